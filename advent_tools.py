@@ -1,13 +1,21 @@
 """Tools to help solve advent of code problems faster"""
 import abc
 import collections
+import concurrent.futures
 import contextlib
 import copy
 import datetime
+import functools
+import gzip
 import hashlib
+import heapq
+import inspect
 import itertools
 import os
+import pickle
 import shutil
+import tempfile
+import time
 import urllib.request
 
 from matplotlib import pyplot as plt
@@ -206,6 +214,84 @@ class PlottingGrid:
         """
         return np.sum(self.grid != 0)
 
+    def distance_field(self, sources, wall_value=1, max_steps=None):
+        """Number of steps from the nearest source to each cell of the grid
+
+        A breadth-first flood fill done a whole layer at a time: the
+        frontier is a boolean array, shifted one cell in each of the four
+        directions to get the next one. Much faster than searching cell by
+        cell with StateForGraphs when the state is just a position.
+
+        Args:
+            sources: [(int, int)]
+                (row, column) positions to measure from, all at distance 0
+            wall_value: float
+                Value in the grid of cells that can't be entered
+            max_steps: int
+                If given, stop filling after this many steps
+
+        Returns:
+            distances : np.ndarray
+                Array the same shape as the grid holding the distance to
+                each cell, or -1 for cells that weren't reached
+        """
+        open_cells = self.grid != wall_value
+        distances = np.full(self.grid.shape, -1, dtype=int)
+        frontier = np.zeros(self.grid.shape, dtype=bool)
+        for y_pos, x_pos in sources:
+            frontier[y_pos, x_pos] = True
+        reached = frontier.copy()
+        num_steps = 0
+        while frontier.any():
+            distances[frontier] = num_steps
+            if num_steps == max_steps:
+                break
+            new_frontier = np.zeros_like(frontier)
+            new_frontier[1:, :] |= frontier[:-1, :]
+            new_frontier[:-1, :] |= frontier[1:, :]
+            new_frontier[:, 1:] |= frontier[:, :-1]
+            new_frontier[:, :-1] |= frontier[:, 1:]
+            frontier = new_frontier & open_cells & ~reached
+            reached |= frontier
+            num_steps = num_steps + 1
+        return distances
+
+    def steps_between(self, source, target, wall_value=1):
+        """Number of steps on the shortest path between two cells
+
+        Args:
+            source: (int, int)
+                (row, column) position to start from
+            target: (int, int)
+                (row, column) position to get to
+            wall_value: float
+                Value in the grid of cells that can't be entered
+
+        Returns:
+            num_steps : int
+                Length of the shortest path, or None if there isn't one
+        """
+        num_steps = self.distance_field([source], wall_value)[target]
+        return None if num_steps < 0 else int(num_steps)
+
+    def count_within_steps(self, sources, max_steps, wall_value=1):
+        """Count the cells that can be reached in at most max_steps steps
+
+        Args:
+            sources: [(int, int)]
+                (row, column) positions to start from
+            max_steps: int
+                Maximum number of steps to take
+            wall_value: float
+                Value in the grid of cells that can't be entered
+
+        Returns:
+            count : int
+                Number of cells, including the sources, within max_steps
+        """
+        distances = self.distance_field(sources, wall_value, max_steps)
+        return int(np.sum(distances >= 0))
+
 
 class StateForGraphs(abc.ABC):
     """A starter for a state class for use in graph traversal
@@ -217,6 +303,17 @@ class StateForGraphs(abc.ABC):
     so that only __str__ must be implemented by the child object. But if
     that doesn't work, just override __hash__ and __eq__ directly.
 
+    Building a string for every hash and comparison gets expensive in big
+    searches, so the search functions below actually store the result of
+    key() rather than the state itself. key() works out the state's
+    canonical form with canonicalize() the first time it's called and
+    caches it on the state. By default that is just str(self), but
+    overriding canonicalize() to return something compact and hashable (an
+    int, a tuple or bytes) skips the string building entirely. __hash__ and
+    __eq__ use key() too, so the two always agree. Since the key is cached,
+    don't change a state after using it in a set or a search; copies made
+    with copy.deepcopy work out their own key again.
+
     The second requirement is to implement possible_next_states,
     which provides the edges of the graphs connected to this node, or state.
     That's where the real meat of the problem will end up.
@@ -224,10 +321,14 @@ class StateForGraphs(abc.ABC):
     The third requirement is to implement is_final, which tells the BFS
     search when it has reached the destination node.
 
+    number_of_bidirectional_bfs_steps also needs the destination node
+    itself. Either pass it in, or give the class a final_state method which
+    builds and returns it.
+
     Notes for optimization of breadth-first searches:
         - If two states are equivalent in some way, as in the steps required
-            don't depend on any differences between them, make their string
-            representations the same, so that they compare as equal
+            don't depend on any differences between them, make canonicalize
+            return the same thing for both, so that they compare as equal
         - Look for patterns in the best strategies. Don't return paths
             guaranteed to be suboptimal from possible_next_states
     """
@@ -238,11 +339,48 @@ class StateForGraphs(abc.ABC):
         """
         pass
 
+    def canonicalize(self):
+        """Work out a compact hashable value identifying this state
+
+        Two states with the same canonical form are treated as the same node
+        by the search functions, so this is the place to reduce away any
+        symmetries of the problem. Override this to return something cheaper
+        to build and hash than the string representation. Only called once
+        per state; use key() to get the result.
+
+        Returns:
+            key : hashable
+                str(self) unless overridden
+        """
+        return str(self)
+
+    def key(self):
+        """Return the canonical form of this state, cached after the first call
+
+        Returns:
+            key : hashable
+                The result of canonicalize
+        """
+        try:
+            return self._canonical_key
+        except AttributeError:
+            self._canonical_key = self.canonicalize()
+            return self._canonical_key
+
+    def __getstate__(self):
+        # Leave the cached key out of copies, which are usually made to be
+        # changed, and out of pickles sent to other processes
+        state = self.__dict__.copy()
+        state.pop('_canonical_key', None)
+        return state
+
     def __hash__(self):
-        return hash(str(self))
+        return hash(self.key())
 
     def __eq__(self, other):
-        return str(self) == str(other)
+        if not isinstance(other, StateForGraphs):
+            return NotImplemented
+        return self.key() == other.key()
 
     @abc.abstractmethod
     def is_final(self):
@@ -272,13 +410,555 @@ class StateForGraphs(abc.ABC):
         """
         return set(copy.deepcopy(self))
 
+    def heuristic(self):
+        """Estimate the cost of the remaining path to a final state
+
+        Only used by shortest_path_astar. The estimate must never be more
+        than the true remaining cost, or the search may return a path that
+        isn't the shortest. The default of 0 turns the search into
+        Dijkstra's algorithm.
+
+        Returns:
+            estimate : int
+                Lower bound on the cost from this state to a final state
+        """
+        return 0
+
+    def remaining_upper_bound(self):
+        """Most steps the rest of any path to a final state could take
+
+        Only used by longest_path_dfs, which skips states that can't lead
+        to a path longer than the longest already found. The bound must
+        never be less than the true longest remaining path, or the search
+        may miss it. The default of None means there is no known bound, so
+        nothing is skipped.
+
+        Returns:
+            bound : int
+                Upper bound on the steps from this state to a final state,
+                or None
+        """
+        return None
+
+    def step_cost(self, new_state):
+        """Cost of the step from this state to one of its next states
+
+        Only used by shortest_path_astar; the breadth-first searches count
+        every step as 1, which is the default here too.
+
+        Args:
+            new_state: StateForGraphs
+                One of the states returned by possible_next_states
+
+        Returns:
+            cost : int
+                Non-negative cost of moving from this state to new_state
+        """
+        return 1
+
+    def possible_previous_states(self):
+        """Create and return states from which this one is reachable in a step
+
+        Only needed for number_of_bidirectional_bfs_steps, which searches
+        backwards from the final state as well as forwards from the start.
+        By default the graph is assumed to be undirected, so the states
+        this one can be reached from are the ones it can reach. Override
+        this if that's not true, and don't prune the result the way
+        possible_next_states might, since the optimal path back to the start
+        doesn't have to follow the same strategy.
+
+        Returns:
+            Set of StateForGraphs
+                States from which this state is reachable in one step
+        """
+        return self.possible_next_states()
+
+
+class VisitedSet(set):
+    """The set of state keys already discovered by a breadth-first search
+
+    This is just a set, which is what the searches use unless they are
+    given something else. Anything with add, __contains__, __len__ and
+    start_layer can be passed in its place, for example SpillingVisitedSet.
+    """
+
+    def start_layer(self):
+        """Mark that keys added from now on are one step further away
+
+        Called by the searches each time they start expanding the states of
+        a new layer, so after all the keys of the next layer have been
+        added. Does nothing here.
+
+        Returns:
+            None
+        """
+        pass
+
+
+class SpillingVisitedSet:
+    """A visited set for searches with more states than fit in memory
+
+    The most recent layers of keys are kept in memory as sets. Older layers
+    are reduced to 16-byte digests of their pickled keys and merged into a
+    sorted file on disk, which is memory-mapped and searched with a binary
+    search. Each layer is merged into the file a chunk at a time, so
+    lookups of old keys are much slower than a plain set, but the memory
+    used only depends on the size of the last few layers.
+
+    Keys must pickle the same way every time they are equal, which is the
+    case for ints, strings, bytes and tuples of those, but not for sets.
+    Two different keys having the same digest is possible in principle,
+    but at 128 bits it won't happen in any search that finishes.
+
+    Use it as a context manager, or call close, to delete the file. In a
+    checkpoint, the spilled digests are streamed into the file after the
+    pickle, and are loaded back into a new directory alongside the
+    original one.
+    """
+
+    def __init__(self, directory=None, layers_in_memory=2,
+                 chunk_size=1 << 20):
+        """Constructor
+
+        Args:
+            directory: str
+                Where to put the spilled keys. Defaults to a new temporary
+                directory
+            layers_in_memory: int
+                Number of the most recent layers to keep in memory
+            chunk_size: int
+                Number of digests read from the file at a time when merging
+                a layer into it
+        """
+        self.layers_in_memory = layers_in_memory
+        self.chunk_size = chunk_size
+        self.parent_directory = directory
+        self.directory = tempfile.mkdtemp(dir=directory)
+        self.layers = collections.deque([set()])
+        self.spilled = np.zeros(0, dtype='S16')
+        self.num_spills = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Delete the spilled keys from disk
+
+        Returns:
+            None
+        """
+        self.spilled = np.zeros(0, dtype='S16')
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @staticmethod
+    def digest(key):
+        """Reduce a key to the fixed-width form stored on disk
+
+        Args:
+            key: hashable
+                Key of a state, as returned by StateForGraphs.key
+
+        Returns:
+            digest : bytes
+                16 bytes identifying the key
+        """
+        return hashlib.blake2b(pickle.dumps(key, protocol=4),
+                               digest_size=16).digest()
+
+    def __contains__(self, key):
+        for layer in reversed(self.layers):
+            if key in layer:
+                return True
+        if not len(self.spilled):
+            return False
+        digest = self.digest(key)
+        index = np.searchsorted(self.spilled, digest)
+        # Indexing an 'S16' array strips trailing zero bytes, so compare
+        # the raw bytes instead
+        return (index < len(self.spilled)
+                and self.spilled[index:index + 1].tobytes() == digest)
+
+    def __len__(self):
+        return len(self.spilled) + sum(len(layer) for layer in self.layers)
+
+    def add(self, key):
+        """Add a key which is not already in the set
+
+        Args:
+            key: hashable
+                Key of a state, as returned by StateForGraphs.key
+
+        Returns:
+            None
+        """
+        self.layers[-1].add(key)
+
+    def start_layer(self):
+        """Start a new layer of keys, spilling old layers to disk if needed
+
+        Returns:
+            None
+        """
+        self.layers.append(set())
+        while len(self.layers) > self.layers_in_memory:
+            self.spill(self.layers.popleft())
+
+    def spill(self, keys):
+        """Merge a collection of keys into the sorted file on disk
+
+        Args:
+            keys: iterable of hashable
+                Keys of states, as returned by StateForGraphs.key
+
+        Returns:
+            None
+        """
+        digests = np.unique(np.array([self.digest(key) for key in keys],
+                                     dtype='S16'))
+        file_name = self.new_file_name()
+        with open(file_name, 'wb') as out_file:
+            position = 0
+            for start in range(0, len(self.spilled), self.chunk_size):
+                chunk = self.spilled[start:start + self.chunk_size]
+                # The new digests that sort among those in this chunk
+                end = np.searchsorted(digests, chunk[-1], side='right')
+                np.union1d(chunk, digests[position:end]).tofile(out_file)
+                position = end
+            digests[position:].tofile(out_file)
+        self.map_spilled(file_name)
+
+    def write_spilled(self, digests):
+        """Replace the file on disk with a new sorted array of digests
+
+        Args:
+            digests: np.ndarray
+                Sorted, distinct digests of all the spilled keys
+
+        Returns:
+            None
+        """
+        file_name = self.new_file_name()
+        digests.tofile(file_name)
+        self.map_spilled(file_name)
+
+    def new_file_name(self):
+        """Name of a file to write the next version of the digests to"""
+        self.num_spills = self.num_spills + 1
+        return os.path.join(self.directory, f'visited_{self.num_spills}.bin')
+
+    def map_spilled(self, file_name):
+        """Memory-map a file of digests, deleting the previous one
+
+        Args:
+            file_name: str
+                File holding the sorted, distinct digests of all the
+                spilled keys
+
+        Returns:
+            None
+        """
+        old_file_name = getattr(self.spilled, 'filename', None)
+        if os.path.getsize(file_name):
+            self.spilled = np.memmap(file_name, dtype='S16', mode='r')
+        else:
+            self.spilled = np.zeros(0, dtype='S16')
+        if old_file_name:
+            os.remove(old_file_name)
+
+    def __getstate__(self):
+        # The spilled digests could be bigger than memory, so only their
+        # number is pickled. save_search_checkpoint writes the digests
+        # themselves after the pickle with dump_spilled, and
+        # load_search_checkpoint reads them back with load_spilled
+        state = self.__dict__.copy()
+        state['spilled'] = len(self.spilled)
+        del state['directory']
+        return state
+
+    def __setstate__(self, state):
+        self.num_unloaded = state.pop('spilled')
+        self.__dict__.update(state)
+        self.directory = tempfile.mkdtemp(dir=self.parent_directory)
+        self.spilled = np.zeros(0, dtype='S16')
+
+    def dump_spilled(self, out_file):
+        """Write the spilled digests to a file, a chunk at a time
+
+        Args:
+            out_file: file
+                Open binary file, just after this set has been pickled to it
+
+        Returns:
+            None
+        """
+        for start in range(0, len(self.spilled), self.chunk_size):
+            out_file.write(
+                self.spilled[start:start + self.chunk_size].tobytes())
+
+    def load_spilled(self, in_file):
+        """Read back the digests written by dump_spilled after unpickling
+
+        Args:
+            in_file: file
+                Open binary file, just after this set was unpickled from it
+
+        Returns:
+            None
+        """
+        file_name = self.new_file_name()
+        with open(file_name, 'wb') as out_file:
+            remaining = 16 * self.num_unloaded
+            while remaining:
+                data = in_file.read(min(remaining, 16 * self.chunk_size))
+                if not data:
+                    raise EOFError('checkpoint ends before its digests')
+                out_file.write(data)
+                remaining = remaining - len(data)
+        self.num_unloaded = 0
+        self.map_spilled(file_name)
+
+
+class BfsLayer(collections.namedtuple('BfsLayer', [
+        'depth', 'states', 'num_discovered', 'num_expanded', 'num_generated',
+        'elapsed', 'layer_time', 'final_state'])):
+    """One layer of a breadth-first search, as yielded by bfs_layers
+
+    Attributes:
+        depth: int
+            Number of steps from the start to each state in this layer
+        states: [StateForGraphs]
+            The newly discovered states in this layer, the frontier
+        num_discovered: int
+            Total number of distinct states discovered so far
+        num_expanded: int
+            Number of states of the previous layer expanded to get this one
+        num_generated: int
+            Number of states returned by possible_next_states while
+            expanding them, duplicates included
+        elapsed: float
+            Seconds since the start of the search
+        layer_time: float
+            Seconds spent finding this layer
+        final_state: StateForGraphs
+            The final state found in this layer, if the search was told to
+            stop at one, otherwise None
+    """
+    __slots__ = ()
+
+    @property
+    def branching_factor(self):
+        """Average number of next states per expanded state, or None"""
+        if not self.num_expanded:
+            return None
+        return self.num_generated / self.num_expanded
+
+    @property
+    def throughput(self):
+        """States expanded per second while finding this layer, or None"""
+        if not self.layer_time:
+            return None
+        return self.num_expanded / self.layer_time
+
+    def __str__(self):
+        branching = self.branching_factor
+        throughput = self.throughput
+        return (f'depth {self.depth}: {len(self.states)} new, '
+                f'{self.num_discovered} discovered, branching '
+                f'{"-" if branching is None else f"{branching:.2f}"}, '
+                f'{"-" if throughput is None else f"{throughput:.0f}"}'
+                f' states/s, {self.elapsed:.2f}s elapsed')
+
+
+def save_search_checkpoint(file_name, search_key, depth, states, visited):
+    """Save the state of a layer-by-layer search so it can be resumed
+
+    The file is written next to file_name first and then moved into place,
+    so a search killed while saving still leaves the previous checkpoint.
+
+    Args:
+        file_name: str
+            Path of the checkpoint file
+        search_key: hashable
+            What the search is, such as the key of the state it started
+            from and any parameters that change how far it goes, so that a
+            different search doesn't resume from the checkpoint
+        depth: int
+            Number of steps from the start to each state in states
+        states: [StateForGraphs]
+            The frontier of the search, which must be picklable
+        visited: VisitedSet
+            Keys of all the states discovered so far
+
+    Returns:
+        None
+    """
+    temp_file_name = file_name + '.tmp'
+    with gzip.open(temp_file_name, 'wb', compresslevel=1) as out_file:
+        pickle.dump((search_key, depth, states, visited), out_file,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+        if isinstance(visited, SpillingVisitedSet):
+            visited.dump_spilled(out_file)
+    os.replace(temp_file_name, file_name)
+
+
+def load_search_checkpoint(file_name, search_key):
+    """Load a checkpoint written by save_search_checkpoint
+
+    Args:
+        file_name: str
+            Path of the checkpoint file
+        search_key: hashable
+            What the search to resume is, as passed to
+            save_search_checkpoint
+
+    Returns:
+        depth : int
+            Number of steps from the start to each state in states
+        states : [StateForGraphs]
+            The frontier of the search
+        visited : VisitedSet
+            Keys of all the states discovered so far
+
+    Raises:
+        ValueError
+            If the checkpoint is of a different search, from another start
+            state or with other parameters
+    """
+    with gzip.open(file_name, 'rb') as in_file:
+        saved_search_key, depth, states, visited = pickle.load(in_file)
+        if saved_search_key != search_key:
+            if hasattr(visited, 'close'):
+                visited.close()
+            raise ValueError(f'{file_name} is a checkpoint of a different '
+                             f'search')
+        if isinstance(visited, SpillingVisitedSet):
+            visited.load_spilled(in_file)
+    return depth, states, visited
+
+
+def bfs_layers(current_state, stop_at_final=False, visited=None,
+               checkpoint_file=None, checkpoint_interval=600,
+               search_parameters=()):
+    """Perform a breadth-first search, yielding one layer at a time
+
+    The first layer is just current_state, at depth 0. Each following layer
+    holds the states first discovered one step further away, along with
+    some numbers about how the search is going. The next layer isn't
+    worked out until it is asked for, so stop iterating to stop the search.
+
+    Args:
+        current_state: StateForGraphs
+            The state at the beginning of the search; the root of the tree.
+        stop_at_final: bool
+            Whether to check each new state with is_final. If so, the layer
+            in which a final state is found is cut short there and is the
+            last one yielded, with the final state in its final_state field
+        visited: VisitedSet
+            Where to keep the keys of discovered states. Defaults to a new,
+            in-memory VisitedSet
+        checkpoint_file: str
+            If given, the frontier and visited keys are saved to this file
+            at the end of a layer, whenever checkpoint_interval seconds have
+            passed since the last save. If the file already exists, the
+            search resumes from it, and visited is replaced by the saved
+            one. The file is left behind when the search ends, and is only
+            resumed by a search from the same state with the same
+            stop_at_final and search_parameters
+        checkpoint_interval: float
+            Minimum number of seconds between checkpoints
+        search_parameters: tuple
+            Anything else about the search that a checkpoint should match,
+            like the number of steps a caller will stop at
+
+    Yields:
+        layer : BfsLayer
+            The next layer of the search, until there are no new states
 
-def number_of_bfs_steps(current_state):
+    See Also: StateForGraphs
+        to understand the required methods for the states used in the graph.
+        The states must implement key and possible_next_states, and
+        is_final if stop_at_final is True
+    """
+    start_time = time.perf_counter()
+    start_key = current_state.key()
+    search_key = (start_key, stop_at_final, tuple(search_parameters))
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        depth, states, discovered = load_search_checkpoint(checkpoint_file,
+                                                           search_key)
+        layer = BfsLayer(depth, states, len(discovered), 0, 0, 0.0, 0.0,
+                         None)
+    else:
+        discovered = VisitedSet() if visited is None else visited
+        discovered.add(start_key)
+        layer = BfsLayer(0, [current_state], 1, 0, 0, 0.0, 0.0, None)
+    try:
+        yield from _bfs_layers_from(layer, discovered, stop_at_final,
+                                    start_time, checkpoint_file,
+                                    checkpoint_interval, search_key)
+    finally:
+        if discovered is not visited and hasattr(discovered, 'close'):
+            # Loaded from the checkpoint, so nothing else will close it
+            discovered.close()
+
+
+def _bfs_layers_from(layer, discovered, stop_at_final, start_time,
+                     checkpoint_file, checkpoint_interval, search_key):
+    """Carry on a search from one layer, for bfs_layers"""
+    last_checkpoint = start_time
+    while True:
+        if (checkpoint_file and layer.final_state is None
+                and layer.layer_time
+                and time.perf_counter() - last_checkpoint
+                >= checkpoint_interval):
+            save_search_checkpoint(checkpoint_file, search_key, layer.depth,
+                                   layer.states, discovered)
+            last_checkpoint = time.perf_counter()
+        yield layer
+        if layer.final_state is not None:
+            return
+        layer_start = time.perf_counter()
+        discovered.start_layer()
+        frontier = []
+        num_expanded = 0
+        num_generated = 0
+        final_state = None
+        for state in layer.states:
+            num_expanded = num_expanded + 1
+            new_states = state.possible_next_states()
+            num_generated = num_generated + len(new_states)
+            for new_state in new_states:
+                if stop_at_final and new_state.is_final():
+                    final_state = new_state
+                    break
+                new_key = new_state.key()
+                if new_key not in discovered:
+                    discovered.add(new_key)
+                    frontier.append(new_state)
+            if final_state is not None:
+                break
+        if not frontier and final_state is None:
+            return
+        now = time.perf_counter()
+        layer = BfsLayer(layer.depth + 1, frontier, len(discovered),
+                         num_expanded, num_generated, now - start_time,
+                         now - layer_start, final_state)
+
+
+def number_of_bfs_steps(current_state, visited=None, checkpoint_file=None):
     """Perform a breadth-first search and return number of steps taken
 
     Args:
         current_state: StateForGraphs
             The state at the beginning of the search; the root of the tree.
+        visited: VisitedSet
+            Where to keep the keys of discovered states. Defaults to a new,
+            in-memory VisitedSet
+        checkpoint_file: str
+            File to periodically save the search to, and resume it from if
+            it exists. See bfs_layers
 
     Returns:
         The number of steps required to get from current_state to
@@ -287,25 +967,176 @@ def number_of_bfs_steps(current_state):
 
     See Also: StateForGraphs
         to understand the required methods for the states used in the graph.
-        The states must implement __hash__, __eq__, possible_next_states,
-        and is_final
+        The states must implement key, possible_next_states, and is_final
     """
-    queue = collections.deque()
-    discovered = {current_state: 0}
-    queue.append(current_state)
-    while queue:
-        state = queue.popleft()
-        num_steps = discovered[state]
-        new_states = state.possible_next_states()
-        for new_state in new_states:
+    for layer in bfs_layers(current_state, stop_at_final=True,
+                            visited=visited, checkpoint_file=checkpoint_file):
+        if layer.final_state is not None:
+            return layer.depth
+
+
+def _expand_chunk(states):
+    """Find the distinct states reachable in one step from a chunk of states
+
+    Runs in a worker process for parallel_number_of_bfs_steps. Children are
+    deduplicated by key here, to cut down on what gets pickled back.
+
+    Args:
+        states: [StateForGraphs]
+            Part of one layer of the search
+
+    Returns:
+        found_final : bool
+            Whether any of the new states is final
+        children : [(hashable, StateForGraphs)]
+            Key and state of each distinct new state, empty if found_final
+    """
+    children = {}
+    for state in states:
+        for new_state in state.possible_next_states():
             if new_state.is_final():
-                return num_steps + 1
-            if new_state not in discovered:
-                discovered[new_state] = num_steps + 1
-                queue.append(new_state)
+                return True, []
+            children.setdefault(new_state.key(), new_state)
+    return False, list(children.items())
+
+
+def parallel_number_of_bfs_steps(current_state, max_workers=None,
+                                 chunk_size=None, checkpoint_file=None,
+                                 checkpoint_interval=600):
+    """Perform a breadth-first search on several processes
+
+    Same result as number_of_bfs_steps, but the search proceeds one whole
+    layer at a time. Each layer is split into chunks which worker processes
+    expand with possible_next_states, and the new states are checked
+    against the discovered states back in this process. Worth it when
+    possible_next_states is the expensive part, since the states have to be
+    pickled on the way to and from the workers.
+
+    Args:
+        current_state: StateForGraphs
+            The state at the beginning of the search; the root of the tree.
+            It and the states it leads to must be picklable
+        max_workers: int
+            Number of worker processes. Defaults to the number of CPUs
+        chunk_size: int
+            Number of states sent to a worker at once. Defaults to
+            splitting each layer into four chunks per worker
+        checkpoint_file: str
+            File to save the search to at the end of a layer, and resume it
+            from if it exists. See bfs_layers
+        checkpoint_interval: float
+            Minimum number of seconds between checkpoints
+
+    Returns:
+        The number of steps required to get from current_state to
+        a final state, or None if no final state can be reached
+
+    See Also: StateForGraphs
+        to understand the required methods for the states used in the graph.
+        The states must implement key, possible_next_states, and is_final
+    """
+    num_workers = max_workers or os.cpu_count() or 1
+    start_key = current_state.key()
+    search_key = (start_key, 'parallel')
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        num_steps, frontier, discovered = load_search_checkpoint(
+            checkpoint_file, search_key)
+    else:
+        discovered = VisitedSet([start_key])
+        frontier = [current_state]
+        num_steps = 0
+    last_checkpoint = time.perf_counter()
+    executor = concurrent.futures.ProcessPoolExecutor(num_workers)
+    try:
+        while frontier:
+            if (checkpoint_file and time.perf_counter() - last_checkpoint
+                    >= checkpoint_interval):
+                save_search_checkpoint(checkpoint_file, search_key,
+                                       num_steps, frontier, discovered)
+                last_checkpoint = time.perf_counter()
+            layer_chunk_size = (chunk_size
+                                or -(-len(frontier) // (4 * num_workers)))
+            chunks = [frontier[start:start + layer_chunk_size] for start
+                      in range(0, len(frontier), layer_chunk_size)]
+            num_steps = num_steps + 1
+            frontier = []
+            for found_final, children in executor.map(_expand_chunk, chunks):
+                if found_final:
+                    return num_steps
+                for new_key, new_state in children:
+                    if new_key not in discovered:
+                        discovered.add(new_key)
+                        frontier.append(new_state)
+    finally:
+        executor.shutdown(cancel_futures=True)
+    return None
+
+
+def smallest_passing_value(predicate, start=0, max_workers=None,
+                           max_pending=None):
+    """Find the smallest integer for which predicate is true, on many processes
+
+    Integers from start upwards are handed out in order to a pool of worker
+    processes. Once one passes, no more are handed out, and those bigger
+    than it which haven't started yet are cancelled. Only the smaller ones
+    still running are waited for, in case one of them passes too.
 
+    Args:
+        predicate: callable
+            Picklable function (so defined at the top level of a module)
+            taking an int. The int passes if what it returns is true, and
+            what it returns for the smallest passing int is returned too,
+            so it can return something it worked out, rather than just
+            True. It must always return eventually, for example by giving
+            up after some number of steps
+        start: int
+            First integer to try
+        max_workers: int
+            Number of worker processes. Defaults to the number of CPUs
+        max_pending: int
+            Maximum number of integers handed out but not finished. Defaults
+            to four per worker
 
-def number_of_reachable_in_steps(current_state, max_steps):
+    Returns:
+        value : int
+            The smallest integer, no less than start, which passes. Runs
+            forever if there isn't one
+        result
+            What predicate returned for it
+    """
+    num_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 4 * num_workers
+    candidates = itertools.count(start)
+    pending = {}
+    smallest = None
+    smallest_result = None
+    executor = concurrent.futures.ProcessPoolExecutor(num_workers)
+    try:
+        while True:
+            while smallest is None and len(pending) < max_pending:
+                candidate = next(candidates)
+                pending[executor.submit(predicate, candidate)] = candidate
+            if not pending:
+                return smallest, smallest_result
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                candidate = pending.pop(future)
+                result = future.result()
+                if result and (smallest is None or candidate < smallest):
+                    smallest = candidate
+                    smallest_result = result
+            if smallest is not None:
+                for future, candidate in list(pending.items()):
+                    if candidate > smallest:
+                        future.cancel()
+                        del pending[future]
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def number_of_reachable_in_steps(current_state, max_steps, visited=None,
+                                 checkpoint_file=None):
     """Find the number of states reachable from this one in max steps
 
     Use a breadth-first search to figure out how many states are reachable
@@ -319,6 +1150,12 @@ def number_of_reachable_in_steps(current_state, max_steps):
             The maximum number of steps to take, using
             state.possible_next_states to find states reachable in one step
             from the current state
+        visited: VisitedSet
+            Where to keep the keys of discovered states. Defaults to a new,
+            in-memory VisitedSet
+        checkpoint_file: str
+            File to periodically save the search to, and resume it from if
+            it exists. See bfs_layers
 
     Returns:
         number_reachable : int
@@ -327,29 +1164,25 @@ def number_of_reachable_in_steps(current_state, max_steps):
 
     See Also: StateForGraphs
         to understand the required methods for the states used in the graph.
-        The states must implement __hash__, __eq__, and possible_next_states
+        The states must implement key and possible_next_states
     """
-    queue = collections.deque()
-    discovered = {current_state: 0}
-    queue.append(current_state)
-    while queue:
-        state = queue.popleft()
-        num_steps = discovered[state]
-        if num_steps < max_steps:
-            new_states = state.possible_next_states()
-            for new_state in new_states:
-                if new_state not in discovered:
-                    discovered[new_state] = num_steps + 1
-                    queue.append(new_state)
-    return len(discovered)
+    for layer in bfs_layers(current_state, visited=visited,
+                            checkpoint_file=checkpoint_file,
+                            search_parameters=('reachable', max_steps)):
+        if layer.depth >= max_steps:
+            break
+    return layer.num_discovered
 
 
-def longest_path(current_state):
+def longest_path(current_state, visited=None):
     """Find longest possible path from the current state to the final state
 
     Args:
         current_state: StateForGraphs
             The state at the beginning of the search; the root of the tree.
+        visited: VisitedSet
+            Where to keep the keys of discovered states. Defaults to a new,
+            in-memory VisitedSet
 
     Returns:
         The maximum number of steps that can be used to get from
@@ -358,92 +1191,528 @@ def longest_path(current_state):
 
     See Also: StateForGraphs
         to understand the required methods for the states used in the graph.
-        The states must implement __hash__, __eq__, possible_next_states,
-        and is_final
+        The states must implement key, possible_next_states, and is_final
     """
     queue = collections.deque()
-    discovered = {current_state: 0}
-    queue.append(current_state)
+    discovered = VisitedSet() if visited is None else visited
+    discovered.add(current_state.key())
+    queue.append((current_state, 0))
+    layer = 0
     lengths = set()
     while queue:
-        state = queue.popleft()
-        num_steps = discovered[state]
+        state, num_steps = queue.popleft()
+        if num_steps > layer:
+            discovered.start_layer()
+            layer = num_steps
         new_states = state.possible_next_states()
         for new_state in new_states:
             if new_state.is_final():
                 lengths.add(num_steps + 1)
-            elif new_state not in discovered:
-                queue.append(new_state)
-            discovered[new_state] = num_steps + 1
+                continue
+            new_key = new_state.key()
+            if new_key not in discovered:
+                discovered.add(new_key)
+                queue.append((new_state, num_steps + 1))
     return max(lengths)
 
 
-def find_final_state(current_state):
-    """Return the final state found in shortest steps using a BFS search
+def longest_path_dfs(current_state, upper_bound=None):
+    """Find longest possible path to the final state with a depth-first search
+
+    Same result as longest_path on graphs where each state can only be
+    reached one way, like when the state includes the path taken to get
+    there, but only the states along the current path are held in memory,
+    rather than every state seen. States already on the current path are
+    skipped, so this finds the longest path that doesn't revisit a state.
+
+    If the states implement remaining_upper_bound, it is used to prune the
+    search: once a path has been found, a state whose path so far plus its
+    bound is no longer than that path isn't searched any further.
 
     Args:
         current_state: StateForGraphs
             The state at the beginning of the search; the root of the tree.
+        upper_bound: int
+            Known maximum length of any path. If given, the search stops as
+            soon as it finds a path this long
 
     Returns:
-        final_state: StateForGraphs
-            The first state that returns true for its is_final method,
-            when using a breadth-first search
+        The maximum number of steps that can be used to get from
+        current_state to a final state, or None if no final state can be
+        reached
 
     See Also: StateForGraphs
         to understand the required methods for the states used in the graph.
-        The states must implement __hash__, __eq__, possible_next_states,
-        and is_final
+        The states must implement key, possible_next_states, and is_final
     """
-    queue = collections.deque()
-    discovered = {current_state: 0}
-    queue.append(current_state)
-    while queue:
-        state = queue.popleft()
-        num_steps = discovered[state]
-        new_states = state.possible_next_states()
-        for new_state in new_states:
-            if new_state.is_final():
-                return new_state
-            if new_state not in discovered:
-                discovered[new_state] = num_steps + 1
-                queue.append(new_state)
-
+    start_key = current_state.key()
+    on_path = {start_key}
+    stack = [(start_key, iter(current_state.possible_next_states()))]
+    longest = None
+    while stack:
+        key, new_states = stack[-1]
+        new_state = next(new_states, None)
+        if new_state is None:
+            stack.pop()
+            on_path.discard(key)
+            continue
+        num_steps = len(stack)
+        if new_state.is_final():
+            if longest is None or num_steps > longest:
+                longest = num_steps
+                if longest == upper_bound:
+                    return longest
+            continue
+        new_key = new_state.key()
+        if new_key in on_path:
+            continue
+        if longest is not None:
+            bound = new_state.remaining_upper_bound()
+            if bound is not None and num_steps + bound <= longest:
+                continue
+        on_path.add(new_key)
+        stack.append((new_key, iter(new_state.possible_next_states())))
+    return longest
+
+
+def number_of_bidirectional_bfs_steps(current_state, final_state=None):
+    """Perform a breadth-first search from both ends and return number of steps
+
+    Expands whole layers at a time, always from whichever end currently has
+    the smaller frontier, and stops at the end of the first layer in which
+    the two searches meet. Each side explores roughly the square root of
+    the states that number_of_bfs_steps would, so this is worth it when the
+    number of states blows up with the number of steps.
 
-class Computer(abc.ABC):
-    """A virtual machine base class for running custom assembly languages
+    Args:
+        current_state: StateForGraphs
+            The state at the beginning of the search; the root of the tree.
+        final_state: StateForGraphs
+            The state at the end of the search. If None, it is built
+            with current_state.final_state(), which must exist
 
-    Seems that Topaz likes to put problems that require virtual machines
-    with registers that run his own small assembly languages. There was one
-    in 2015 (day 23) and one in 2016 (day 12) and a much more complex one
-    used on many days in 2019. This probably doesn't implement enough for
-    the 2019 IntCode computer but it works for 2015 and 2016.
+    Returns:
+        The number of steps required to get from current_state to
+        final_state, or None if it can't be reached
 
-    To use this, inherit from this class. Include the following two lines at
-    the start of the class:
-        operation = advent_tools.Computer.operation
-        return_register = 'a'
-    (setting return_register to the register that the question requests) and
-    then decorate all assembly commands with @operation('cmd') where cmd is
-    the first word of the instruction to call that command. The operations
-    can use self.registers to access the computer's registers
+    See Also: StateForGraphs
+        to understand the required methods for the states used in the graph.
+        The states must implement key, possible_next_states and
+        possible_previous_states, unless the graph is undirected
     """
+    if final_state is None:
+        if not hasattr(current_state, 'final_state'):
+            raise ValueError(f'{type(current_state).__name__} has no '
+                             f'final_state method, so pass the final state')
+        final_state = current_state.final_state()
+    start_key = current_state.key()
+    final_key = final_state.key()
+    if start_key == final_key:
+        return 0
+    frontiers = [{start_key: current_state}, {final_key: final_state}]
+    discovered = [{start_key: 0}, {final_key: 0}]
+    depths = [0, 0]
+    expanders = [lambda state: state.possible_next_states(),
+                 lambda state: state.possible_previous_states()]
+    while frontiers[0] and frontiers[1]:
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        other_discovered = discovered[1 - side]
+        num_steps = depths[side] + 1
+        next_frontier = {}
+        shortest = None
+        for state in frontiers[side].values():
+            for new_state in expanders[side](state):
+                new_key = new_state.key()
+                if new_key in other_discovered:
+                    total = num_steps + other_discovered[new_key]
+                    if shortest is None or total < shortest:
+                        shortest = total
+                if new_key not in discovered[side]:
+                    discovered[side][new_key] = num_steps
+                    next_frontier[new_key] = new_state
+        if shortest is not None:
+            return shortest
+        frontiers[side] = next_frontier
+        depths[side] = num_steps
+    return None
+
+
+def shortest_path_astar(current_state):
+    """Perform an A* search and return the cost of the cheapest path
+
+    States are expanded cheapest first, ordered by the cost so far plus
+    state.heuristic(), with state.step_cost giving the cost of each step.
+    With the default heuristic and step cost, this returns the same number
+    as number_of_bfs_steps, but a good heuristic means far fewer states
+    need to be expanded to get there.
 
-    operation_map = {}
-
-    def __init__(self):
-        self.registers = collections.defaultdict(int)
-        self.instruction_pointer = 0
+    Args:
+        current_state: StateForGraphs
+            The state at the beginning of the search; the root of the tree.
 
-    @property
-    @abc.abstractmethod
-    def return_register(self):
-        """The register to return at the end of the program"""
-        pass
+    Returns:
+        The total cost of the cheapest path from current_state to a final
+        state, or None if no final state can be reached
 
-    @classmethod
-    def operation(cls, instruction_first_word):
-        """Mark a method as an operation
+    See Also: StateForGraphs
+        to understand the required methods for the states used in the graph.
+        The states must implement key, possible_next_states, and is_final,
+        and may implement heuristic and step_cost
+    """
+    tie_breaker = itertools.count()
+    start_key = current_state.key()
+    costs = {start_key: 0}
+    queue = [(current_state.heuristic(), next(tie_breaker), 0, start_key,
+              current_state)]
+    while queue:
+        _, _, cost, key, state = heapq.heappop(queue)
+        if state.is_final():
+            return cost
+        if cost > costs[key]:
+            # A cheaper way to this state was found after this was queued
+            continue
+        for new_state in state.possible_next_states():
+            new_cost = cost + state.step_cost(new_state)
+            new_key = new_state.key()
+            if new_key not in costs or new_cost < costs[new_key]:
+                costs[new_key] = new_cost
+                heapq.heappush(queue, (new_cost + new_state.heuristic(),
+                                       next(tie_breaker), new_cost, new_key,
+                                       new_state))
+    return None
+
+
+def find_final_state(current_state, checkpoint_file=None):
+    """Return the final state found in shortest steps using a BFS search
+
+    Args:
+        current_state: StateForGraphs
+            The state at the beginning of the search; the root of the tree.
+        checkpoint_file: str
+            File to periodically save the search to, and resume it from if
+            it exists. See bfs_layers
+
+    Returns:
+        final_state: StateForGraphs
+            The first state that returns true for its is_final method,
+            when using a breadth-first search
+
+    See Also: StateForGraphs
+        to understand the required methods for the states used in the graph.
+        The states must implement key, possible_next_states, and is_final
+    """
+    for layer in bfs_layers(current_state, stop_at_final=True,
+                            checkpoint_file=checkpoint_file):
+        if layer.final_state is not None:
+            return layer.final_state
+
+
+def _is_int(word):
+    """Whether a word of an instruction is a number"""
+    try:
+        int(word)
+    except ValueError:
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def _register_operands(func):
+    """Work out which operands of an operation have to be registers
+
+    Goes by the naming convention for operation arguments described in
+    Computer: arguments ending in key_or_val may be a register or a
+    number, other arguments ending in key must be a register.
+
+    Args:
+        func: callable
+            An operation, as stored in Computer.operation_map
+
+    Returns:
+        register_only : (bool)
+            For each operand, whether it must be a register
+    """
+    parameters = list(inspect.signature(func).parameters)[1:]
+    return tuple(name.endswith('key') for name in parameters)
+
+
+class RegisterFile:
+    """The registers of a Computer, kept in a list of slots
+
+    Each register name gets a small integer slot the first time it's used,
+    so decoded programs can refer to registers by slot and skip hashing
+    their names. Numbers in a program get slots too, holding the number,
+    so that an operand is always a slot whatever it is. Registers can
+    still be read and set by name, like a collections.defaultdict(int).
+    """
+
+    __slots__ = ('slots', 'names', 'constants')
+
+    def __init__(self):
+        self.slots = []
+        self.names = {}
+        self.constants = {}
+
+    def slot(self, name):
+        """Get the slot of a register, giving it one if it's new
+
+        Args:
+            name: str
+                Name of the register
+
+        Returns:
+            slot : int
+                Index of the register in self.slots
+        """
+        try:
+            return self.names[name]
+        except KeyError:
+            self.names[name] = len(self.slots)
+            self.slots.append(0)
+            return self.names[name]
+
+    def constant(self, value):
+        """Get a slot which always holds a number
+
+        Args:
+            value: int
+                The number
+
+        Returns:
+            slot : int
+                Index in self.slots of a slot holding value, which no
+                operation should ever write to
+        """
+        try:
+            return self.constants[value]
+        except KeyError:
+            self.constants[value] = len(self.slots)
+            self.slots.append(value)
+            return self.constants[value]
+
+    def __getitem__(self, name):
+        return self.slots[self.slot(name)]
+
+    def __setitem__(self, name, value):
+        self.slots[self.slot(name)] = value
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def items(self):
+        """Names and values of the registers, like dict.items"""
+        return [(name, self.slots[slot]) for name, slot in self.names.items()]
+
+    def __repr__(self):
+        return f'RegisterFile({dict(self.items())})'
+
+
+class ExecutionProfile:
+    """Counts of what a Computer did while running a program
+
+    Made by Computer.run_program when called with profile=True.
+
+    Attributes:
+        program: [str]
+            The program that was run, as it was at the end
+        counts: collections.Counter
+            Number of times the instruction at each position was run
+        jumps: collections.Counter
+            Number of times each (from, to) jump was taken, meaning the
+            branch at from was followed by the instruction at to, rather
+            than the next one
+        branches: set
+            Positions of the branches that were run, the instructions
+            whose operation is one of the computer's branch_operations
+        superinstructions: dict
+            Number of instructions replaced by each superinstruction that
+            was run, by position
+    """
+
+    def __init__(self, program):
+        self.program = program
+        self.counts = collections.Counter()
+        self.jumps = collections.Counter()
+        self.branches = set()
+        self.superinstructions = {}
+
+    def taken(self, index):
+        """Number of times the instruction at index jumped somewhere"""
+        return sum(count for (start, _), count in self.jumps.items()
+                   if start == index)
+
+    def hot_loops(self):
+        """Loops formed by backward jumps, most often repeated first
+
+        Returns:
+            [(int, int, int, int)]
+                Start and end of the loop body, number of times the jump
+                back was taken, and number of instructions run in the body
+        """
+        loops = []
+        for (start, end), count in self.jumps.items():
+            if end <= start:
+                body_count = sum(self.counts[index]
+                                 for index in range(end, start + 1))
+                loops.append((end, start, count, body_count))
+        return sorted(loops, key=lambda loop: loop[3], reverse=True)
+
+    def describe(self, index):
+        """The instruction at index, or what a superinstruction replaced"""
+        if index in self.superinstructions:
+            replaced = self.program[index:index
+                                    + self.superinstructions[index]]
+            return f'superinstruction: {"; ".join(replaced)}'
+        return self.program[index]
+
+    def report(self, top=10):
+        """Describe the hottest instructions, jumps and loops
+
+        Args:
+            top: int
+                Number of instructions and loops to list
+
+        Returns:
+            report : str
+                Several lines of text to print
+        """
+        total = sum(self.counts.values())
+        lines = [f'{total} instructions run',
+                 '   ip      count      taken  not taken  instruction']
+        for index, count in self.counts.most_common(top):
+            if index in self.branches:
+                taken = self.taken(index)
+                branch_counts = f'{taken:10d} {count - taken:10d}'
+            else:
+                branch_counts = f'{"":10} {"":10}'
+            lines.append(f'{index:5d} {count:10d} {branch_counts}  '
+                         f'{self.describe(index)}')
+        lines.append('Hottest loops (backward jumps)')
+        for end, start, count, body_count in self.hot_loops()[:top]:
+            lines.append(f'{end:5d}-{start:<5d} repeated {count} times, '
+                         f'{body_count} instructions run in the body')
+            index = end
+            while index <= start:
+                lines.append(f'{"":12}{self.describe(index)}')
+                index = index + self.superinstructions.get(index, 1)
+        return '\n'.join(lines)
+
+
+class ComputerSnapshot(collections.namedtuple('ComputerSnapshot', [
+        'instruction_pointer', 'slots', 'program'])):
+    """The state of a Computer, as returned by Computer.snapshot
+
+    Attributes:
+        instruction_pointer: int
+            Position in the program of the next instruction to run
+        slots: (int)
+            Contents of the computer's slots, its registers and numbers
+        program: (str)
+            The program, including any changes made while running it
+    """
+    __slots__ = ()
+
+
+class Computer(abc.ABC):
+    """A virtual machine base class for running custom assembly languages
+
+    Seems that Topaz likes to put problems that require virtual machines
+    with registers that run his own small assembly languages. There was one
+    in 2015 (day 23) and one in 2016 (day 12) and a much more complex one
+    used on many days in 2019. This probably doesn't implement enough for
+    the 2019 IntCode computer but it works for 2015 and 2016.
+
+    To use this, inherit from this class. Include the following two lines at
+    the start of the class:
+        operation = advent_tools.Computer.operation
+        return_register = 'a'
+    (setting return_register to the register that the question requests) and
+    then decorate all assembly commands with @operation('cmd') where cmd is
+    the first word of the instruction to call that command. The registers
+    are in self.registers, which can be read and set by name from outside.
+    Each subclass gets its own operation_map, holding its operations and
+    those of the classes it inherits from, so an operation defined in one
+    subclass doesn't turn up in another. Overriding the method of an
+    operation, without decorating it again, replaces the operation.
+
+    For assembunny, the language of 2016, inherit from AssembunnyComputer
+    or one of its subclasses instead, which have the operations and a fast
+    way to run them already.
+
+    Programs are decoded once when they are loaded, into the operation to
+    call and its operands. Each operand is decoded to the index of a slot
+    in self.slots, the list holding the values of the registers, which also
+    has read-only slots holding the numbers that appear in the program.
+    Name the arguments of an operation ending in key_or_val if they can be
+    either a register or a number, and read them with
+    self.get_key_or_val. Name them ending in key if they have to be a
+    register, in which case they can also be written with
+    self.slots[key] = value; an instruction with a number there is invalid
+    and is skipped. If an operation changes the program, it must do so
+    with self.set_instruction, so that the decoded copy is kept up to date.
+
+    Set peephole_rules to a sequence of functions that spot common runs of
+    instructions, such as loops that just add or multiply, and replace
+    them with a single superinstruction when the program is decoded. See
+    assembunny_add_loop for what a rule looks like.
+
+    Set compiler to a function that translates the loaded program into
+    Python, like compile_assembunny, to run it as compiled code rather than
+    one instruction at a time. Anything the compiler can't handle is still
+    run by the interpreter, and the program is compiled again whenever
+    set_instruction changes it.
+
+    To stop a program part way through, give run_program a max_steps or
+    max_time budget, and call run to carry on. snapshot and restore save
+    and go back to the state of the computer, so that a program can be
+    run to some point once and then carried on from there several ways.
+
+    To find out where a program spends its time, set branch_operations to
+    the first words of the instructions that jump, run the program with
+    run_program(program, profile=True) and print self.profile.report().
+    Loops that the peephole rules already replace show up as a single
+    instruction, so what's left are the loops worth writing new rules for.
+    """
+
+    operation_map = {}
+    peephole_rules = ()
+    compiler = None
+    branch_operations = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.operation_map = {}
+        for klass in reversed(cls.__mro__):
+            for attribute, func in vars(klass).items():
+                name = getattr(func, 'operation_name', None)
+                if name is not None:
+                    cls.operation_map[name] = getattr(cls, attribute)
+
+    def __init__(self):
+        self.registers = RegisterFile()
+        self.slots = self.registers.slots
+        self.instruction_pointer = 0
+        self.program = []
+        self.decoded = []
+        self.superinstructions = {}
+        self.compiled = None
+        self.profile = None
+
+    @property
+    @abc.abstractmethod
+    def return_register(self):
+        """The register to return at the end of the program"""
+        pass
+
+    @classmethod
+    def operation(cls, instruction_first_word):
+        """Mark a method as an operation
 
         Args:
             instruction_first_word: str
@@ -455,10 +1724,158 @@ class Computer(abc.ABC):
         """
         def decorator(func):
             """Decorator to mark a method as an operation"""
-            cls.operation_map[instruction_first_word] = func
+            func.operation_name = instruction_first_word
             return func
         return decorator
 
+    def skip(self):
+        """Do nothing, in place of an invalid instruction"""
+        pass
+
+    def halt(self):
+        """Stop the program once the operation being run returns"""
+        # run_program moves on to the next instruction, which is past the end
+        self.instruction_pointer = len(self.program) - 1
+
+    def get_key_or_val(self, key_or_val):
+        """Get the value of an operand that is a register or a number
+
+        Args:
+            key_or_val: int
+                Decoded operand; the slot of a register or a number
+
+        Returns:
+            int
+                The number, or the contents of the register
+        """
+        return self.slots[key_or_val]
+
+    def decode_operand(self, word):
+        """Decode one word of an instruction into a slot
+
+        Args:
+            word: str
+                A register name or a number
+
+        Returns:
+            slot : int
+                Index of the register or number in self.slots
+        """
+        try:
+            value = int(word)
+        except ValueError:
+            return self.registers.slot(word)
+        return self.registers.constant(value)
+
+    def decode(self, instruction):
+        """Turn an instruction into an operation and its operands
+
+        Args:
+            instruction: str
+                Instruction to decode. Must start with a valid operation
+                identifier (key of self.operation_map)
+
+        Returns:
+            func : callable
+                The operation to run, or skip if the instruction is invalid
+            operands : tuple
+                Arguments to the operation after self, the slots of each
+                register or number
+        """
+        words = instruction.split()
+        func = self.operation_map[words[0]]
+        register_only = _register_operands(func)
+        for position, word in enumerate(words[1:]):
+            if (position < len(register_only) and register_only[position]
+                    and _is_int(word)):
+                return Computer.skip, ()
+        return func, tuple(self.decode_operand(word) for word in words[1:])
+
+    def load_program(self, program):
+        """Store and decode a program, ready to run it
+
+        Args:
+            program: [str]
+                Instructions, each of which starts with a valid operation
+                identifier
+
+        Returns:
+            None
+        """
+        self.program = program
+        self.decoded = [None] * len(program)
+        self.superinstructions = {}
+        for index in range(len(program)):
+            self.decoded[index] = self.decode_at(index)
+        self.compiled = None
+
+    def decode_at(self, index):
+        """Decode the instruction at some position in the loaded program
+
+        If one of the peephole rules matches the instructions starting
+        there, they are replaced by its superinstruction.
+
+        Args:
+            index: int
+                Position in the program of the instruction to decode
+
+        Returns:
+            func : callable
+                The operation to run
+            operands : tuple
+                Arguments to the operation after self
+        """
+        self.superinstructions.pop(index, None)
+        for rule in self.peephole_rules:
+            match = rule(self, index)
+            if match:
+                length, func, operands = match
+                self.superinstructions[index] = length
+                return func, operands
+        return self.decode(self.program[index])
+
+    def set_instruction(self, index, instruction):
+        """Change an instruction of the loaded program
+
+        Args:
+            index: int
+                Position in the program of the instruction to change
+            instruction: str
+                The new instruction
+
+        Returns:
+            None
+        """
+        self.program[index] = instruction
+        self.decoded[index] = None
+        self.compiled = None
+        for start, length in list(self.superinstructions.items()):
+            if start <= index < start + length:
+                # The superinstruction may no longer do the same thing
+                self.decoded[start] = None
+                del self.superinstructions[start]
+
+    def fetch(self):
+        """Get the decoded instruction at the instruction pointer
+
+        Returns:
+            func : callable
+                The operation to run
+            operands : tuple
+                Arguments to the operation after self
+
+        Raises:
+            IndexError
+                If the instruction pointer is outside the program
+        """
+        if self.instruction_pointer < 0:
+            raise IndexError('instruction pointer before start of program')
+        decoded = self.decoded[self.instruction_pointer]
+        if decoded is None:
+            decoded = self.decode_at(self.instruction_pointer)
+            self.decoded[self.instruction_pointer] = decoded
+        return decoded
+
     def run_instruction(self, instruction):
         """Run a single instruction
 
@@ -473,11 +1890,11 @@ class Computer(abc.ABC):
         Returns:
             None
         """
-        words = instruction.split()
-        func = self.operation_map[words[0]]
-        func(self, *words[1:])
+        func, operands = self.decode(instruction)
+        func(self, *operands)
 
-    def run_program(self, program):
+    def run_program(self, program, profile=False, max_steps=None,
+                    max_time=None):
         """Run a list of instructions through the virtual machine
 
         The program terminates when the instruction pointer moves past the
@@ -487,17 +1904,139 @@ class Computer(abc.ABC):
             program: [str]
                 Instructions, each of which starts with a valid operation
                 identifier
+            profile: bool
+                Whether to count each instruction and jump as it runs, into
+                self.profile. The program is interpreted rather than
+                compiled, so this is much slower
+            max_steps: int
+                If given, stop after running this many instructions
+            max_time: float
+                If given, stop after roughly this many seconds
+        Returns:
+            int
+                Contents of the return register when the program
+                terminates, or None if it ran out of steps or time first,
+                in which case self.run carries on from where it stopped
+        """
+        self.load_program(program)
+        if profile:
+            return self.run_profiled()
+        if self.run(max_steps, max_time):
+            return self.registers[self.return_register]
+        return None
+
+    def run(self, max_steps=None, max_time=None):
+        """Run the loaded program from the current instruction pointer
+
+        With a budget of steps or time, the program is interpreted rather
+        than compiled, because compiled code runs whole loops at once
+        without counting them. A superinstruction counts as one step.
+        Time is only checked every thousand steps.
+
+        Args:
+            max_steps: int
+                If given, stop after running this many instructions
+            max_time: float
+                If given, stop after roughly this many seconds
+
+        Returns:
+            finished : bool
+                True if the program terminated, False if it ran out of
+                steps or time first
+        """
+        num_instructions = len(self.program)
+        if max_steps is None and max_time is None:
+            decoded = self.decoded
+            while 0 <= self.instruction_pointer < num_instructions:
+                if self.compiler is not None:
+                    if self.compiled is None:
+                        self.compiled = self.compiler()
+                    run_compiled, entry_points = self.compiled
+                    if self.instruction_pointer in entry_points:
+                        run_compiled(self)
+                        continue
+                func, operands = (decoded[self.instruction_pointer]
+                                  or self.fetch())
+                func(self, *operands)
+                self.instruction_pointer = self.instruction_pointer + 1
+            return True
+        if max_time is not None:
+            deadline = time.perf_counter() + max_time
+        steps = 0
+        while 0 <= self.instruction_pointer < num_instructions:
+            if max_steps is not None and steps >= max_steps:
+                return False
+            if (max_time is not None and steps % 1000 == 0
+                    and time.perf_counter() >= deadline):
+                return False
+            func, operands = self.fetch()
+            func(self, *operands)
+            self.instruction_pointer = self.instruction_pointer + 1
+            steps = steps + 1
+        return True
+
+    def snapshot(self):
+        """Save where the computer has got to, to go back to with restore
+
+        Returns:
+            ComputerSnapshot
+                The instruction pointer, registers and program
+        """
+        return ComputerSnapshot(self.instruction_pointer, tuple(self.slots),
+                                tuple(self.program))
+
+    def restore(self, snapshot):
+        """Go back to a snapshot taken earlier with this computer's snapshot
+
+        Only instructions that have changed since the snapshot are decoded
+        again, so this is cheap if the program hasn't changed much.
+
+        Args:
+            snapshot: ComputerSnapshot
+                As returned by snapshot
+
+        Returns:
+            None
+        """
+        if len(snapshot.program) != len(self.program):
+            self.load_program(list(snapshot.program))
+        else:
+            for index, instruction in enumerate(snapshot.program):
+                if self.program[index] != instruction:
+                    self.set_instruction(index, instruction)
+        self.slots[:len(snapshot.slots)] = snapshot.slots
+        for slot in self.registers.names.values():
+            if slot >= len(snapshot.slots):
+                # A register first used after the snapshot was taken
+                self.slots[slot] = 0
+        self.instruction_pointer = snapshot.instruction_pointer
+
+    def run_profiled(self):
+        """Run the loaded program, counting instructions and jumps
+
         Returns:
             int
                 Contents of the return register when the program terminates
         """
-        while True:
-            try:
-                line = program[self.instruction_pointer]
-            except IndexError:
-                return self.registers[self.return_register]
-            self.run_instruction(line)
+        self.profile = ExecutionProfile(self.program)
+        counts = self.profile.counts
+        jumps = self.profile.jumps
+        while 0 <= self.instruction_pointer < len(self.program):
+            index = self.instruction_pointer
+            func, operands = self.fetch()
+            func(self, *operands)
             self.instruction_pointer = self.instruction_pointer + 1
+            counts[index] = counts[index] + 1
+            if index in self.superinstructions:
+                # Skipping over the instructions it replaced isn't a jump
+                self.profile.superinstructions[index] = (
+                    self.superinstructions[index])
+            elif self.program[index].split()[0] in self.branch_operations:
+                self.profile.branches.add(index)
+                if self.instruction_pointer != index + 1:
+                    jumps[index, self.instruction_pointer] = (
+                        jumps[index, self.instruction_pointer] + 1)
+        return self.registers[self.return_register]
 
     def run_input_file(self):
         """Run the contents of today's input file through the virtual machine
@@ -510,6 +2049,690 @@ class Computer(abc.ABC):
         return self.run_program(program)
 
 
+def _parse_add_loop(words):
+    """Recognize an assembunny loop that adds one register to another
+
+    The loop is an inc or dec of the target and an inc or dec of the
+    counter, in either order, followed by jnz counter -2.
+
+    Args:
+        words: [[str]]
+            The words of three instructions
+
+    Returns:
+        None if the instructions aren't such a loop, otherwise
+        target : str
+            Register being added to
+        target_step : int
+            1 if the target is incremented, -1 if decremented
+        counter : str
+            Register counting the iterations down (or up) to zero
+        counter_step : int
+            1 if the counter is incremented, -1 if decremented
+    """
+    if len(words) != 3 or [len(word) for word in words] != [2, 2, 3]:
+        return None
+    steps = {'inc': 1, 'dec': -1}
+    if (words[0][0] not in steps or words[1][0] not in steps
+            or words[2][0] != 'jnz' or words[2][2] != '-2'):
+        return None
+    counter = words[2][1]
+    if words[0][1] == counter:
+        (counter_op, _), (target_op, target) = words[:2]
+    elif words[1][1] == counter:
+        (target_op, target), (counter_op, _) = words[:2]
+    else:
+        return None
+    if (target == counter or not target.isalpha()
+            or not counter.isalpha()):
+        return None
+    return target, steps[target_op], counter, steps[counter_op]
+
+
+def _run_add_loop(computer, target, target_step, counter, counter_step,
+                  fallback):
+    """Superinstruction for a loop found by assembunny_add_loop"""
+    slots = computer.slots
+    iterations = -counter_step * slots[counter]
+    if iterations > 0:
+        slots[target] = slots[target] + target_step * iterations
+        slots[counter] = 0
+        computer.instruction_pointer = computer.instruction_pointer + 2
+    else:
+        # The counter would go the wrong way, so just run the loop as is
+        func, operands = fallback
+        func(computer, *operands)
+
+
+def assembunny_add_loop(computer, index):
+    """Peephole rule replacing assembunny loops that add with one instruction
+
+    Matches loops like
+        inc a
+        dec b
+        jnz b -2
+    which add b to a and set b to 0, and variations with inc and dec
+    swapped or in the other order.
+
+    Args:
+        computer: Computer
+            The computer, with the program loaded
+        index: int
+            Position in the program to look for a loop at
+
+    Returns:
+        None if there is no loop at index, otherwise
+        length : int
+            Number of instructions replaced
+        func : callable
+            The superinstruction, which takes the computer as its first
+            argument, and falls back to running the first instruction
+            if the loop wouldn't terminate
+        operands : tuple
+            Arguments to func after the computer
+    """
+    words = [line.split() for line in computer.program[index:index + 3]]
+    loop = _parse_add_loop(words)
+    if loop is None:
+        return None
+    target, target_step, counter, counter_step = loop
+    fallback = computer.decode(computer.program[index])
+    return 3, _run_add_loop, (computer.registers.slot(target), target_step,
+                              computer.registers.slot(counter), counter_step,
+                              fallback)
+
+
+def _parse_multiply_loop(words):
+    """Recognize an assembunny loop that adds a product to a register
+
+    The loop is a cpy of the source into the counter, a loop like those
+    recognized by _parse_add_loop, and an inc or dec of the outer counter
+    followed by jnz outer_counter -5.
+
+    Args:
+        words: [[str]]
+            The words of six instructions
+
+    Returns:
+        None if the instructions aren't such a loop, otherwise
+        source : str
+            Register or number copied into the counter
+        target, target_step, counter, counter_step
+            As returned by _parse_add_loop, for the inner loop
+        outer_counter : str
+            Register counting the outer iterations
+        outer_step : int
+            1 if the outer counter is incremented, -1 if decremented
+    """
+    if len(words) != 6 or words[0][0] != 'cpy' or len(words[0]) != 3:
+        return None
+    inner = _parse_add_loop(words[1:4])
+    if inner is None:
+        return None
+    target, target_step, counter, counter_step = inner
+    source = words[0][1]
+    if words[0][2] != counter or source in (target, counter):
+        return None
+    steps = {'inc': 1, 'dec': -1}
+    if (len(words[4]) != 2 or words[4][0] not in steps
+            or words[5] != ['jnz', words[4][1], '-5']):
+        return None
+    outer_counter = words[4][1]
+    if (outer_counter in (source, target, counter)
+            or not outer_counter.isalpha()):
+        return None
+    return (source, target, target_step, counter, counter_step,
+            outer_counter, steps[words[4][0]])
+
+
+def _run_multiply_loop(computer, source, target, target_step, counter,
+                       counter_step, outer_counter, outer_step, fallback):
+    """Superinstruction for a loop found by assembunny_multiply_loop"""
+    slots = computer.slots
+    iterations = -counter_step * slots[source]
+    outer_iterations = -outer_step * slots[outer_counter]
+    if iterations > 0 and outer_iterations > 0:
+        slots[target] = (slots[target]
+                         + target_step * iterations * outer_iterations)
+        slots[counter] = 0
+        slots[outer_counter] = 0
+        computer.instruction_pointer = computer.instruction_pointer + 5
+    else:
+        func, operands = fallback
+        func(computer, *operands)
+
+
+def assembunny_multiply_loop(computer, index):
+    """Peephole rule replacing assembunny multiplying loops with one operation
+
+    Matches nested loops like
+        cpy b c
+        inc a
+        dec c
+        jnz c -2
+        dec d
+        jnz d -5
+    which add b * d to a and set c and d to 0, with the same variations
+    of the inner loop as assembunny_add_loop, and the outer counter
+    counting up or down.
+
+    Args:
+        computer: Computer
+            The computer, with the program loaded
+        index: int
+            Position in the program to look for a loop at
+
+    Returns:
+        None if there is no loop at index, otherwise the same as
+        assembunny_add_loop
+    """
+    words = [line.split() for line in computer.program[index:index + 6]]
+    loop = _parse_multiply_loop(words)
+    if loop is None:
+        return None
+    (source, target, target_step, counter, counter_step, outer_counter,
+     outer_step) = loop
+    slot = computer.registers.slot
+    fallback = computer.decode(computer.program[index])
+    return 6, _run_multiply_loop, (computer.decode_operand(source),
+                                   slot(target), target_step, slot(counter),
+                                   counter_step, slot(outer_counter),
+                                   outer_step, fallback)
+
+
+ASSEMBUNNY_PEEPHOLE_RULES = (assembunny_multiply_loop, assembunny_add_loop)
+
+
+def _assembunny_value(word):
+    """Python expression for an assembunny operand in compiled code"""
+    return word if _is_int(word) else 'r_' + word
+
+
+def _can_compile_assembunny(words):
+    """Whether compile_assembunny can translate an instruction"""
+    arg_counts = {'cpy': 2, 'inc': 1, 'dec': 1, 'jnz': 2}
+    return (arg_counts.get(words[0]) == len(words) - 1
+            and all(word.isalpha() or _is_int(word) for word in words[1:]))
+
+
+def _assembunny_statements(words):
+    """Python statements for a cpy, inc or dec instruction"""
+    if words[0] == 'cpy':
+        if words[2].isalpha():
+            return [f'r_{words[2]} = {_assembunny_value(words[1])}']
+    elif words[1].isalpha():
+        step = '+' if words[0] == 'inc' else '-'
+        return [f'r_{words[1]} = r_{words[1]} {step} 1']
+    # A number where a register should be is an invalid instruction
+    return []
+
+
+def _can_compile_superinstruction(computer, index):
+    """Whether _assembunny_superinstruction knows the one at index"""
+    func, _ = computer.decoded[index]
+    return func in (_run_add_loop, _run_multiply_loop)
+
+
+def _assembunny_superinstruction(computer, words, index):
+    """Python code for a superinstruction from ASSEMBUNNY_PEEPHOLE_RULES
+
+    Returns:
+        None if the superinstruction isn't one of the known ones, otherwise
+        a list of lines of code ending the block
+    """
+    func, _ = computer.decoded[index]
+    length = computer.superinstructions[index]
+    program_words = [line.split()
+                     for line in computer.program[index:index + length]]
+    if func is _run_add_loop:
+        target, target_step, counter, counter_step = _parse_add_loop(
+            program_words)
+        iterations = f'{-counter_step} * r_{counter}'
+        outer_iterations = '1'
+        resets = [f'r_{counter} = 0']
+    elif func is _run_multiply_loop:
+        (source, target, target_step, counter, counter_step, outer_counter,
+         outer_step) = _parse_multiply_loop(program_words)
+        iterations = f'{-counter_step} * {_assembunny_value(source)}'
+        outer_iterations = f'{-outer_step} * r_{outer_counter}'
+        resets = [f'r_{counter} = 0', f'r_{outer_counter} = 0']
+    else:
+        return None
+    return ([f'iterations = {iterations}',
+             f'outer_iterations = {outer_iterations}',
+             'if iterations > 0 and outer_iterations > 0:',
+             f'    r_{target} = (r_{target} + {target_step} * iterations'
+             f' * outer_iterations)']
+            + ['    ' + line for line in resets]
+            + [f'    ip = {index + length}', '    continue']
+            + _assembunny_statements(words)
+            + [f'ip = {index + 1}', 'continue'])
+
+
+def _assembunny_block(computer, program, start, leaders):
+    """Lines of Python for the basic block starting at start"""
+    lines = []
+    index = start
+    while True:
+        if index >= len(program):
+            return lines + [f'ip = {index}', 'break']
+        words = program[index]
+        if index in computer.superinstructions:
+            code = _assembunny_superinstruction(computer, words, index)
+            if code is None:
+                return lines + [f'ip = {index}', 'break']
+            return lines + code
+        if not _can_compile_assembunny(words):
+            # Let the interpreter run it, then come back
+            return lines + [f'ip = {index}', 'break']
+        if words[0] == 'jnz':
+            offset = words[2]
+            target = (index + int(offset) if _is_int(offset)
+                      else f'{index} + r_{offset}')
+            return lines + [f'if {_assembunny_value(words[1])}:',
+                            f'    ip = {target}',
+                            '    continue',
+                            f'ip = {index + 1}',
+                            'continue']
+        lines.extend(_assembunny_statements(words))
+        index = index + 1
+        if index in leaders:
+            return lines + [f'ip = {index}', 'continue']
+
+
+def _assembunny_dispatch(entry_points, blocks, indent):
+    """Lines of Python jumping to the block for the instruction pointer
+
+    Uses a binary search over the entry points, so jumping to a block
+    only takes a few comparisons however long the program is.
+    """
+    pad = ' ' * indent
+    if len(entry_points) <= 4:
+        lines = []
+        for entry_point in entry_points:
+            lines.append(f'{pad}if ip == {entry_point}:')
+            lines.extend(f'{pad}    {line}' for line in blocks[entry_point])
+        lines.append(f'{pad}break')
+        return lines
+    middle = len(entry_points) // 2
+    return ([f'{pad}if ip < {entry_points[middle]}:']
+            + _assembunny_dispatch(entry_points[:middle], blocks, indent + 4)
+            + _assembunny_dispatch(entry_points[middle:], blocks, indent))
+
+
+def compile_assembunny(computer):
+    """Translate the program loaded in a computer into a Python function
+
+    The registers become local variables, and the program is split into
+    basic blocks, with a loop jumping between them. cpy, inc, dec and jnz
+    and the superinstructions from ASSEMBUNNY_PEEPHOLE_RULES are
+    translated. The function returns, with the instruction pointer left at
+    the instruction, when it gets to anything else, like tgl or out, or
+    jumps somewhere that isn't the start of a block. Use it by setting
+    compiler = advent_tools.compile_assembunny in the Computer subclass.
+
+    Args:
+        computer: Computer
+            A computer running assembunny, with the program loaded
+
+    Returns:
+        run_compiled : callable
+            Function taking the computer, which runs the program from the
+            computer's instruction pointer and registers, and updates them
+        entry_points : frozenset of int
+            Instruction pointers at which run_compiled can start
+    """
+    program = [line.split() for line in computer.program]
+    registers = sorted({word for words in program for word in words[1:]
+                        if word.isalpha()} | {computer.return_register})
+    leaders = {0}
+    for index, words in enumerate(program):
+        if index in computer.superinstructions:
+            leaders.update((index, index + 1,
+                            index + computer.superinstructions[index]))
+        elif not _can_compile_assembunny(words):
+            leaders.update((index, index + 1))
+        elif words[0] == 'jnz':
+            leaders.add(index + 1)
+            if _is_int(words[2]):
+                leaders.add(index + int(words[2]))
+    blocks = {}
+    for leader in sorted(leaders):
+        if not 0 <= leader < len(program):
+            continue
+        if leader in computer.superinstructions:
+            compilable = _can_compile_superinstruction(computer, leader)
+        else:
+            compilable = _can_compile_assembunny(program[leader])
+        # Anything else isn't an entry point, so the interpreter runs it
+        if compilable:
+            blocks[leader] = _assembunny_block(computer, program, leader,
+                                               leaders)
+    entry_points = sorted(blocks)
+    slots = {name: computer.registers.slot(name) for name in registers}
+    lines = (['def run_compiled(computer):',
+              '    slots = computer.slots']
+             + [f'    r_{name} = slots[{slot}]'
+                for name, slot in slots.items()]
+             + ['    ip = computer.instruction_pointer',
+                '    while True:']
+             + _assembunny_dispatch(entry_points, blocks, 8)
+             + [f'    slots[{slot}] = r_{name}'
+                for name, slot in slots.items()]
+             + ['    computer.instruction_pointer = ip'])
+    namespace = {}
+    exec(compile('\n'.join(lines), '<assembunny>', 'exec'), namespace)
+    return namespace['run_compiled'], frozenset(entry_points)
+
+
+def _toggle_assembunny(words):
+    """The words of an assembunny instruction after a tgl has changed it"""
+    if len(words) == 2:
+        return ['dec' if words[0] == 'inc' else 'inc'] + words[1:]
+    return ['cpy' if words[0] == 'jnz' else 'jnz'] + words[1:]
+
+
+class AssembunnyComputer(Computer):
+    """A Computer running assembunny, the language of 2016
+
+    Has cpy, inc, dec and jnz, and runs programs using the superinstructions
+    from ASSEMBUNNY_PEEPHOLE_RULES and code compiled by compile_assembunny.
+    ToggleAssembunnyComputer adds tgl and SignalAssembunnyComputer adds out.
+    """
+
+    operation = Computer.operation
+    return_register = 'a'
+    peephole_rules = ASSEMBUNNY_PEEPHOLE_RULES
+    compiler = compile_assembunny
+    branch_operations = ('jnz',)
+
+    @operation('cpy')
+    def copy(self, from_key_or_val, to_key):
+        self.slots[to_key] = self.slots[from_key_or_val]
+
+    @operation('inc')
+    def increment(self, key):
+        self.slots[key] = self.slots[key] + 1
+
+    @operation('dec')
+    def decrement(self, key):
+        self.slots[key] = self.slots[key] - 1
+
+    @operation('jnz')
+    def jump_not_zero(self, ref_key_or_val, offset_key_or_val):
+        if self.slots[ref_key_or_val]:
+            self.instruction_pointer = (self.instruction_pointer
+                                        + self.slots[offset_key_or_val] - 1)
+
+
+class ToggleAssembunnyComputer(AssembunnyComputer):
+    """An AssembunnyComputer with tgl, which changes the program as it runs"""
+
+    operation = Computer.operation
+
+    @operation('tgl')
+    def toggle(self, key_or_val):
+        index = self.instruction_pointer + self.slots[key_or_val]
+        if 0 <= index < len(self.program):
+            words = _toggle_assembunny(self.program[index].split())
+            self.set_instruction(index, ' '.join(words))
+
+
+class SignalAssembunnyComputer(AssembunnyComputer):
+    """An AssembunnyComputer with out, which sends a signal
+
+    The values sent are in self.outputs. Override transmit to do something
+    else with them, calling self.halt to stop the program if need be.
+    """
+
+    operation = Computer.operation
+
+    def __init__(self):
+        super().__init__()
+        self.outputs = []
+
+    @operation('out')
+    def transmit(self, key_or_val):
+        self.outputs.append(self.slots[key_or_val])
+
+
+class AssembunnyBatch:
+    """Run one assembunny program for many sets of starting registers at once
+
+    Each set of registers is a lane, and every register holds a numpy array
+    with a value for each lane. Lanes at the same instruction, running the
+    same version of the program, take each step together with numpy
+    operations. When lanes split up, at a jnz or a superinstruction that
+    only some of them can use, the ones furthest behind run first, so that
+    the others wait for them and they join back up as soon as possible.
+    tgl changes the program for just the lanes that run it, which then run
+    separately from the rest until they are back in step.
+
+    cpy, inc, dec, jnz, tgl and out are supported, as are the loops matched
+    by ASSEMBUNNY_PEEPHOLE_RULES. out records each lane's outputs in
+    self.outputs.
+
+    Usage:
+        batch = AssembunnyBatch(program, 1000)
+        batch['a'] = np.arange(1, 1001)
+        batch.run()
+        print(batch['a'])
+    """
+
+    def __init__(self, program, num_lanes, max_outputs=None,
+                 max_steps=None):
+        """Constructor
+
+        Args:
+            program: [str]
+                The assembunny instructions
+            num_lanes: int
+                Number of sets of registers to run the program with
+            max_outputs: int
+                If given, a lane stops once it has output this many values
+            max_steps: int
+                If given, a lane stops once it has run this many
+                instructions, counting a superinstruction as one
+        """
+        self.programs = []
+        self.program_indexes = {}
+        self.program_id([line.split() for line in program])
+        self.names = sorted({word for words in self.programs[0]
+                             for word in words[1:] if word.isalpha()})
+        self.rows = {name: row for row, name in enumerate(self.names)}
+        self.values = np.zeros((len(self.names), num_lanes), dtype=np.int64)
+        self.instruction_pointers = np.zeros(num_lanes, dtype=np.int64)
+        self.program_ids = np.zeros(num_lanes, dtype=np.int64)
+        self.steps = np.zeros(num_lanes, dtype=np.int64)
+        self.outputs = [[] for _ in range(num_lanes)]
+        self.stopped = np.zeros(num_lanes, dtype=bool)
+        self.max_outputs = max_outputs
+        self.max_steps = max_steps
+
+    def __getitem__(self, name):
+        return self.values[self.rows[name]]
+
+    def __setitem__(self, name, values):
+        self.values[self.rows[name]] = values
+
+    def value(self, word, lanes):
+        """Value of an operand for some lanes, as a number or an array"""
+        if word.isalpha():
+            return self.values[self.rows[word], lanes]
+        return int(word)
+
+    def active_lanes(self):
+        """Boolean array of the lanes still running"""
+        num_instructions = len(self.programs[0])
+        active = ((self.instruction_pointers >= 0)
+                  & (self.instruction_pointers < num_instructions)
+                  & ~self.stopped)
+        if self.max_steps is not None:
+            active &= self.steps < self.max_steps
+        return active
+
+    def run(self):
+        """Run every lane until it leaves the program or stops
+
+        Returns:
+            None
+        """
+        active = self.active_lanes()
+        while active.any():
+            instruction_pointer = self.instruction_pointers[active].min()
+            in_step = active & (self.instruction_pointers
+                                == instruction_pointer)
+            program_id = self.program_ids[in_step].min()
+            lanes = np.flatnonzero(in_step
+                                   & (self.program_ids == program_id))
+            self.step(self.programs[program_id], int(instruction_pointer),
+                      lanes)
+            self.steps[lanes] += 1
+            active = self.active_lanes()
+
+    def step(self, program, index, lanes):
+        """Run one instruction, or superinstruction, for a group of lanes
+
+        Args:
+            program: [[str]]
+                The version of the program these lanes are running
+            index: int
+                Their instruction pointer
+            lanes: np.ndarray
+                The lanes
+
+        Returns:
+            None
+        """
+        multiply_loop = _parse_multiply_loop(program[index:index + 6])
+        if multiply_loop is not None:
+            (source, target, target_step, counter, counter_step,
+             outer_counter, outer_step) = multiply_loop
+            iterations = -counter_step * self.value(source, lanes)
+            outer_iterations = -outer_step * self.value(outer_counter, lanes)
+            fast = (iterations > 0) & (outer_iterations > 0)
+            self.run_loop(lanes, fast, index + 6, target,
+                          target_step * iterations * outer_iterations,
+                          (counter, outer_counter))
+            lanes = lanes[~fast]
+        else:
+            add_loop = _parse_add_loop(program[index:index + 3])
+            if add_loop is not None:
+                target, target_step, counter, counter_step = add_loop
+                iterations = -counter_step * self.value(counter, lanes)
+                fast = iterations > 0
+                self.run_loop(lanes, fast, index + 3, target,
+                              target_step * iterations, (counter,))
+                lanes = lanes[~fast]
+        if len(lanes):
+            self.step_instruction(program, index, lanes)
+
+    def run_loop(self, lanes, fast, end, target, increase, counters):
+        """Do what an add or multiply loop would, for the lanes where it ends
+
+        Args:
+            lanes: np.ndarray
+                The lanes at the start of the loop
+            fast: np.ndarray
+                Boolean array saying which of them will finish the loop
+            end: int
+                Instruction after the loop
+            target: str
+                Register the loop adds to
+            increase: np.ndarray
+                Amount added to the target in each lane
+            counters: (str)
+                Registers the loop counts down to zero
+
+        Returns:
+            None
+        """
+        fast_lanes = lanes[fast]
+        self.values[self.rows[target], fast_lanes] += increase[fast]
+        for counter in counters:
+            self.values[self.rows[counter], fast_lanes] = 0
+        self.instruction_pointers[fast_lanes] = end
+
+    def step_instruction(self, program, index, lanes):
+        """Run a single instruction for a group of lanes
+
+        Args:
+            program: [[str]]
+                The version of the program these lanes are running
+            index: int
+                Their instruction pointer
+            lanes: np.ndarray
+                The lanes
+
+        Returns:
+            None
+        """
+        words = program[index]
+        operation = words[0]
+        next_instruction = index + 1
+        if operation == 'cpy':
+            if words[2].isalpha():
+                self.values[self.rows[words[2]], lanes] = self.value(
+                    words[1], lanes)
+        elif operation in ('inc', 'dec'):
+            if words[1].isalpha():
+                step = 1 if operation == 'inc' else -1
+                self.values[self.rows[words[1]], lanes] += step
+        elif operation == 'jnz':
+            jumps = self.value(words[1], lanes) != 0
+            next_instruction = index + np.where(
+                jumps, self.value(words[2], lanes), 1)
+        elif operation == 'tgl':
+            self.toggle(program, index, lanes)
+        elif operation == 'out':
+            values = np.broadcast_to(self.value(words[1], lanes), lanes.shape)
+            for lane, value in zip(lanes, values):
+                self.outputs[lane].append(int(value))
+                if len(self.outputs[lane]) == self.max_outputs:
+                    self.stopped[lane] = True
+        else:
+            raise ValueError(f'Unknown instruction {" ".join(words)}')
+        self.instruction_pointers[lanes] = next_instruction
+
+    def toggle(self, program, index, lanes):
+        """Run tgl for a group of lanes, giving them a new program
+
+        Args:
+            program: [[str]]
+                The version of the program these lanes are running
+            index: int
+                Their instruction pointer
+            lanes: np.ndarray
+                The lanes
+
+        Returns:
+            None
+        """
+        targets = index + np.broadcast_to(
+            self.value(program[index][1], lanes), lanes.shape)
+        for lane, target in zip(lanes, targets):
+            if 0 <= target < len(program):
+                new_program = list(program)
+                new_program[target] = _toggle_assembunny(program[target])
+                self.program_ids[lane] = self.program_id(new_program)
+
+    def program_id(self, program):
+        """Index in self.programs of a version of the program, adding it if new
+
+        Args:
+            program: [[str]]
+                A version of the program
+
+        Returns:
+            program_id : int
+        """
+        key = tuple(' '.join(words) for words in program)
+        if key not in self.program_indexes:
+            self.program_indexes[key] = len(self.programs)
+            self.programs.append(program)
+        return self.program_indexes[key]
+
+
 def md5_increment(salt):
     """Append an increasing integer to the salt and run an md5 hash on it
 
@@ -519,12 +2742,115 @@ def md5_increment(salt):
             characters are increasing integers starting at 0
 
     Yields:
+        count : int
+            The integer appended to the salt
         md5_hash : str
             An md5 hash of the salt prepended to an integer
     """
+    # Hash the salt once, and carry on from a copy of that for each count
+    salted = hashlib.md5(salt.encode('utf-8'))
     for count in itertools.count():
-        hashed = get_md5_hash(salt + str(count))
-        yield count, hashed
+        hasher = salted.copy()
+        hasher.update(b'%d' % count)
+        yield count, hasher.hexdigest()
+
+
+class LeadingZeroNibbles:
+    """Test whether an md5 digest's hex starts with some number of zeros
+
+    Works on the raw bytes from digest(), so hashes that fail don't have to
+    be turned into hex. Use it as the digest_predicate of
+    parallel_md5_increment.
+    """
+
+    def __init__(self, num_zeros):
+        """Constructor
+
+        Args:
+            num_zeros: int
+                Number of hex digits at the start that must be 0
+        """
+        # A digest starts with num_zeros zeros if, as a big-endian number,
+        # it's less than this, and bytes of the same length compare that way
+        if num_zeros > 0:
+            self.limit = (16 ** (32 - num_zeros)).to_bytes(16, 'big')
+        else:
+            self.limit = None
+
+    def __call__(self, digest):
+        return self.limit is None or digest < self.limit
+
+
+def _md5_range(salt, start, stop, predicate, digest_predicate):
+    """Worker for parallel_md5_increment: the matching hashes in a range"""
+    matches = []
+    salted = hashlib.md5(salt.encode('utf-8'))
+    # Compare with a LeadingZeroNibbles limit here, to save calling it
+    if isinstance(digest_predicate, LeadingZeroNibbles):
+        limit = digest_predicate.limit
+    else:
+        limit = None
+    for count in range(start, stop):
+        hasher = salted.copy()
+        hasher.update(b'%d' % count)
+        digest = hasher.digest()
+        if limit is not None:
+            if digest >= limit:
+                continue
+        elif digest_predicate is not None and not digest_predicate(digest):
+            continue
+        hashed = digest.hex()
+        if predicate is None or predicate(hashed):
+            matches.append((count, hashed))
+    return matches
+
+
+def parallel_md5_increment(salt, predicate=None, max_workers=None,
+                           chunk_size=50000, digest_predicate=None):
+    """Like md5_increment, but hashing on many processes
+
+    Ranges of counts are handed out in order to a pool of worker processes,
+    which only send back the hashes that pass the predicate. A few ranges
+    are kept ahead of the one being yielded, so the workers are kept busy.
+
+    Args:
+        salt: str
+            First characters of the string to be hashed. The remaining
+            characters are increasing integers starting at 0
+        predicate: callable
+            Picklable function (so defined at the top level of a module)
+            taking a hash and returning whether to yield it. Defaults to
+            yielding every hash, which is slower than md5_increment
+        max_workers: int
+            Number of worker processes. Defaults to the number of CPUs
+        chunk_size: int
+            Number of counts handed to a worker at a time
+        digest_predicate: callable
+            Like predicate, but taking the 16 raw bytes of the hash, such
+            as a LeadingZeroNibbles. It is checked first, and only hashes
+            that pass it are turned into hex, so it's faster when most
+            hashes fail
+
+    Yields:
+        count : int
+            The integer appended to the salt
+        md5_hash : str
+            The md5 hash, if it passes the predicate, in order of count
+    """
+    num_workers = max_workers or os.cpu_count() or 1
+    starts = itertools.count(0, chunk_size)
+    pending = collections.deque()
+    executor = concurrent.futures.ProcessPoolExecutor(num_workers)
+    try:
+        while True:
+            while len(pending) < 2 * num_workers:
+                start = next(starts)
+                pending.append(executor.submit(
+                    _md5_range, salt, start, start + chunk_size, predicate,
+                    digest_predicate))
+            yield from pending.popleft().result()
+    finally:
+        executor.shutdown(cancel_futures=True)
 
 
 def get_md5_hash(to_hash):
@@ -541,6 +2867,117 @@ def get_md5_hash(to_hash):
     return hashlib.md5(to_hash.encode('utf-8')).hexdigest()
 
 
+def _stretched_md5_range(salt, stretch, start, stop):
+    """Worker for StretchedMd5Store: the digests for a range of counts"""
+    digests = []
+    for count in range(start, stop):
+        hashed = salt + str(count)
+        for _ in range(stretch):
+            hashed = get_md5_hash(hashed)
+        digests.append(hashlib.md5(hashed.encode('utf-8')).digest())
+    return b''.join(digests)
+
+
+class StretchedMd5Store:
+    """Stretched md5 hashes of a salt followed by each count, kept on disk
+
+    A stretched hash is the md5 hash of the salt and count, hashed again,
+    as hex, stretch more times. The 16-byte digests are appended to a file
+    in order of count as they are needed, which is memory-mapped to read
+    them back, so once a count has been hashed it never has to be again,
+    even by a later run. New counts are hashed by a pool of processes.
+    """
+
+    def __init__(self, salt, stretch, directory='.', max_workers=None,
+                 chunk_size=1000):
+        """Constructor
+
+        Args:
+            salt: str
+                First characters of the string to be hashed. The remaining
+                characters are increasing integers starting at 0
+            stretch: int
+                Number of extra times to hash each hash
+            directory: str
+                Where to keep the file, which is named after the salt and
+                stretch. Defaults to the current directory
+            max_workers: int
+                Number of worker processes. Defaults to the number of CPUs
+            chunk_size: int
+                Number of counts hashed by a worker at a time
+        """
+        self.salt = salt
+        self.stretch = stretch
+        self.file_name = os.path.join(directory,
+                                      f'stretched_md5_{salt}_{stretch}.bin')
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        if os.path.exists(self.file_name):
+            # Drop any partly written digest at the end
+            size = os.path.getsize(self.file_name)
+            with open(self.file_name, 'r+b') as out_file:
+                out_file.truncate(size - size % 16)
+        self.map_file()
+
+    def map_file(self):
+        """Memory-map the digests in the file into self.digests
+
+        Returns:
+            None
+        """
+        if os.path.exists(self.file_name) and os.path.getsize(self.file_name):
+            self.digests = np.memmap(self.file_name, dtype=np.uint8,
+                                     mode='r').reshape(-1, 16)
+        else:
+            self.digests = np.zeros((0, 16), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.digests)
+
+    def __getitem__(self, count):
+        """The stretched hash of the salt and count, as hex"""
+        self.extend(count + 1)
+        return self.digests[count].tobytes().hex()
+
+    def extend(self, num_counts):
+        """Make sure the hashes of the first num_counts counts are stored
+
+        Args:
+            num_counts: int
+                Number of counts, from 0, which need to be stored
+
+        Returns:
+            None
+        """
+        if num_counts <= len(self):
+            return
+        starts = range(len(self), num_counts, self.chunk_size)
+        with concurrent.futures.ProcessPoolExecutor(
+                self.max_workers) as executor:
+            chunks = executor.map(
+                _stretched_md5_range, itertools.repeat(self.salt),
+                itertools.repeat(self.stretch), starts,
+                [start + self.chunk_size for start in starts])
+            with open(self.file_name, 'ab') as out_file:
+                for chunk in chunks:
+                    out_file.write(chunk)
+        self.map_file()
+
+    def hashes(self):
+        """Stretched hashes for every count in turn, like md5_increment
+
+        Yields:
+            count : int
+                The integer appended to the salt
+            md5_hash : str
+                The stretched hash, as hex
+        """
+        for count in itertools.count():
+            if count >= len(self):
+                self.extend(count + self.max_workers * self.chunk_size)
+            yield count, self.digests[count].tobytes().hex()
+
+
 if __name__ == '__main__':
     # start_coding_today()
     today = 25
@@ -3,7 +3,6 @@ import collections
 import copy
 import functools
 import itertools
-from datetime import datetime
 
 import numpy as np
 import pandas as pd
@@ -52,6 +51,19 @@ class State(advent_tools.StateForGraphs):
         result.append('E' + str(self.elevator_position))
         return ';'.join(result)
 
+    def canonicalize(self):
+        # Elements are interchangeable, so all that matters is which floor
+        # each generator/microchip pair is on, not which element it is
+        floors = {}
+        for floor, gens in self.generators.items():
+            for gen in gens:
+                floors[gen] = [floor, 0]
+        for floor, mics in self.microchips.items():
+            for mic in mics:
+                floors[mic][1] = floor
+        pairs = sorted(tuple(pair) for pair in floors.values())
+        return self.elevator_position, tuple(pairs)
+
     def get_occupied_floors(self):
         result = []
         for floor in range(1, 5):
@@ -118,6 +130,51 @@ class State(advent_tools.StateForGraphs):
                     break
         return result
 
+    def possible_previous_states(self):
+        # Every move can be undone, so the states this one could have come
+        # from are all the ones reachable from it, without the pruning above
+        result = set()
+        floor_items = ([([mic], []) for mic in
+                        self.microchips[self.elevator_position]]
+                       + [([], [gen]) for gen in
+                          self.generators[self.elevator_position]])
+        for delta_elevator in (1, -1):
+            new_elevator = self.elevator_position + delta_elevator
+            for move_item_count in (1, 2):
+                for moved in itertools.combinations(floor_items,
+                                                    move_item_count):
+                    move_microchips = [mic for mics, _ in moved
+                                       for mic in mics]
+                    move_generators = [gen for _, gens in moved
+                                       for gen in gens]
+                    new_state = self.state_moving_stuff(
+                        move_microchips, move_generators, new_elevator)
+                    if new_state:
+                        result.add(new_state)
+        return result
+
+    def heuristic(self):
+        # Getting everything on or below a floor past it takes at least
+        # 2 * count - 3 moves (carry 2 up, bring 1 back down), and every move
+        # only crosses one floor boundary
+        estimate = 0
+        items_below = 0
+        for floor in range(1, 4):
+            items_below = (items_below + len(self.generators[floor])
+                           + len(self.microchips[floor]))
+            if items_below:
+                estimate = estimate + max(1, 2 * items_below - 3)
+        return estimate
+
+    def final_state(self):
+        final = State()
+        final.elevator_position = 4
+        for gens in self.generators.values():
+            final.generators[4].update(gens)
+        for mics in self.microchips.values():
+            final.microchips[4].update(mics)
+        return final
+
     def state_moving_stuff(self, move_microchips, move_generators,
                            new_elevator):
         new_state = copy.deepcopy(self)
@@ -139,10 +196,9 @@ class State(advent_tools.StateForGraphs):
 def run_part_1():
     initial_state = State()
     initial_state.read_initial_state()
-    start_time = datetime.now()
-    print(advent_tools.number_of_bfs_steps(initial_state))
-    elapsed_time = datetime.now() - start_time
-    print(elapsed_time)
+    for layer in advent_tools.bfs_layers(initial_state, stop_at_final=True):
+        print(layer)
+    print(layer.depth)
 
 
 def run_part_2():
@@ -150,7 +206,7 @@ def run_part_2():
     initial_state.read_initial_state()
     initial_state.microchips[1].update(['elerium', 'dilithium'])
     initial_state.generators[1].update(['elerium', 'dilithium'])
-    print(advent_tools.number_of_bfs_steps(initial_state))
+    print(advent_tools.parallel_number_of_bfs_steps(initial_state))
 
 
 if __name__ == '__main__':
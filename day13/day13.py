@@ -30,6 +30,9 @@ class MazeLocation(advent_tools.StateForGraphs):
     def __str__(self):
         return f'{self.x},{self.y}'
 
+    def canonicalize(self):
+        return self.x, self.y
+
     def possible_next_states(self):
         result = set()
         x = self.x
@@ -44,15 +47,32 @@ class MazeLocation(advent_tools.StateForGraphs):
     def is_final(self):
         return self.x == 31 and self.y == 39
 
+    def heuristic(self):
+        return abs(31 - self.x) + abs(39 - self.y)
+
+    def final_state(self):
+        return MazeLocation(31, 39)
+
+
+class MazeGrid(advent_tools.PlottingGrid):
+
+    def __init__(self, size):
+        # The maze goes on forever, but a path of n steps from (1, 1) can't
+        # get further than n + 1 in either direction
+        super().__init__((size, size))
+        for y_pos in range(size):
+            for x_pos in range(size):
+                self.grid[y_pos, x_pos] = is_wall(x_pos, y_pos)
+
 
 def run_part_1():
-    initial_state = MazeLocation(1, 1)
-    print(advent_tools.number_of_bfs_steps(initial_state))
+    grid = MazeGrid(100)
+    print(grid.steps_between((1, 1), (39, 31)))
 
 
 def run_part_2():
-    initial_state = MazeLocation(1, 1)
-    print(advent_tools.number_of_reachable_in_steps(initial_state, 50))
+    grid = MazeGrid(52)
+    print(grid.count_within_steps([(1, 1)], 50))
 
 if __name__ == '__main__':
     run_part_1()
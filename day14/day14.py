@@ -1,3 +1,4 @@
+import bisect
 import contextlib
 import collections
 import copy
@@ -12,29 +13,38 @@ import advent_tools
 
 
 def md5_increment_2016(salt):
-    for count in itertools.count():
-        the_hash = (salt + str(count))
-        for i in range(2017):
-            the_hash = advent_tools.get_md5_hash(the_hash)
-        yield count, the_hash
-
-
-def find_sixty_four_indexes(hash_series):
-    triple_pattern = r'(.)\1{2,}'
-    indexes = set()
-    watching = []
-    while len(indexes) < 128:
-        count, test_str = next(hash_series)
-        for char, prev_count in watching:
-            if (char * 5) in test_str:
-                indexes.add(prev_count)
-        watching = [(key, old_count) for (key, old_count) in watching
-                    if count - old_count < 1000]
-        match = re.search(triple_pattern, test_str)
-        if match:
-            char = match.groups()[0]
-            watching.append((char, count))
-    return sorted(indexes)[63]
+    # Stretched hashes are slow, so they're kept in a file between runs
+    store = advent_tools.StretchedMd5Store(salt, 2016)
+    yield from store.hashes()
+
+
+TRIPLE_PATTERN = re.compile(r'(.)\1\1')
+QUINTUPLE_PATTERN = re.compile(r'(.)\1{4}')
+
+
+def find_sixty_four_indexes(hash_series, window=1000):
+    # For each character, the counts of the hashes with five of it in a row,
+    # in order, so looking for one in the window after a triple is a bisect
+    quintuples = collections.defaultdict(list)
+    triples = []
+    keys_found = 0
+    for count, test_str in hash_series:
+        for char in set(QUINTUPLE_PATTERN.findall(test_str)):
+            quintuples[char].append(count)
+        match = TRIPLE_PATTERN.search(test_str)
+        triples.append(match.group(1) if match else None)
+        # All of the window after the hash from window counts ago has been
+        # read now, so it can be checked for being a key
+        index = count - window
+        if index < 0 or triples[index] is None:
+            continue
+        positions = quintuples[triples[index]]
+        after = bisect.bisect_right(positions, index)
+        if after < len(positions) and positions[after] <= index + window:
+            keys_found = keys_found + 1
+            if keys_found == 64:
+                return index
+
 
 def run_part_1():
     salt = 'cuanljph'
@@ -44,7 +44,7 @@ def run_part_1():
 def run_part_2():
     passcode = 'hhhxzeay'
     initial_state = MazePath(passcode, (0, 0))
-    print(advent_tools.longest_path(initial_state))
+    print(advent_tools.longest_path_dfs(initial_state))
 
 
 if __name__ == '__main__':
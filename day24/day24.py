@@ -35,6 +35,13 @@ class MazeState(advent_tools.StateForGraphs):
     def __str__(self):
         return self.grid.tostring().decode('utf-16')
 
+    def canonicalize(self):
+        # The walls never change, so the robot position and the goals left
+        # to visit are enough to tell states apart
+        robot = tuple(np.argwhere(self.grid == ROBOT)[0])
+        goals = tuple(map(tuple, np.argwhere(self.grid == GOAL)))
+        return robot, goals
+
     def is_final(self):
         return not((self.grid == GOAL).any())
 
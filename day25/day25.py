@@ -9,87 +9,73 @@ import re
 
 import advent_tools
 
-class MonorailComputer(advent_tools.Computer):
+class MonorailComputer(advent_tools.SignalAssembunnyComputer):
 
-    operation = advent_tools.Computer.operation
-    return_register = 'a'
-
-    def __init__(self):
+    def __init__(self, max_outputs=None):
         super().__init__()
-        self.outputs = []
-        self.done = False
+        self.max_outputs = max_outputs
+        self.failed = False
+        self.periodic = False
+        self.states_at_output = {}
         self.expected_outputs = itertools.cycle([0, 1])
 
-    @operation('cpy')
-    def copy(self, from_key_or_val, to_key):
-        value = self.get_key_or_val(from_key_or_val)
-        self.registers[to_key] = value
-
-    def get_key_or_val(self, from_key_or_val):
-        try:
-            value = int(from_key_or_val)
-        except ValueError:
-            value = self.registers[from_key_or_val]
-        return value
-
-    @operation('inc')
-    def increment(self, key):
-        self.registers[key] = self.registers[key] + 1
-
-    @operation('dec')
-    def decrement(self, key):
-        self.registers[key] = self.registers[key] - 1
-
-    @operation('jnz')
-    def jump_not_zero(self, ref_key_or_val, offset_key_or_val):
-        ref = self.get_key_or_val(ref_key_or_val)
-        offset = self.get_key_or_val(offset_key_or_val)
-        if ref:
-            self.instruction_pointer = self.instruction_pointer + offset - 1
-
-    @operation('out')
-    def output(self, key_or_val):
-        val = self.get_key_or_val(key_or_val)
+    def transmit(self, key_or_val):
+        val = self.slots[key_or_val]
         expected = next(self.expected_outputs)
+        self.outputs.append(val)
         if val != expected:
-            self.done = True
-
-    def run_program(self, program):
-        """Run a list of instructions through the virtual machine
-
-        The program terminates when the instruction pointer moves past the
-        end of the program
-
-        Args:
-            program: [str]
-                Instructions, each of which starts with a valid operation
-                identifier
-        Returns:
-            int
-                Contents of the return register when the program terminates
-        """
-        while not self.done:
-            # if self.instruction_pointer == 2:
-            #     self.registers['d'] = self.registers['d'] + 182 * 14
-            #     self.instruction_pointer = 8
-            # elif self.instruction_pointer == 11:
-            #     self.registers['a'] = self.registers['b'] // 2
-            #     self.instruction_pointer == 19
-            try:
-                line = program[self.instruction_pointer]
-            except IndexError:
-                return self.registers[self.return_register]
-            self.run_instruction(line)
-            self.instruction_pointer = self.instruction_pointer + 1
+            self.failed = True
+            self.halt()
+            return
+        # If the machine gets back to a state it was in at an earlier out,
+        # with an even number of outputs in between, everything from there
+        # on repeats, so the clock signal carries on forever
+        state = (self.instruction_pointer, tuple(self.slots))
+        previous = self.states_at_output.get(state)
+        if previous is not None and (len(self.outputs) - previous) % 2 == 0:
+            self.periodic = True
+            self.halt()
+        self.states_at_output[state] = len(self.outputs)
+        if len(self.outputs) == self.max_outputs:
+            self.halt()
+
+
+def produces_clock_signal(seed, max_outputs=100000, max_steps=10 ** 7):
+    computer = MonorailComputer(max_outputs=max_outputs)
+    computer.registers['a'] = seed
+    computer.run_program(advent_tools.read_input_lines(),
+                         max_steps=max_steps)
+    return computer.periodic
+
+
+def starts_clock_signal(seeds, num_outputs=20, max_steps=200000):
+    """Which seeds start with num_outputs of 0, 1, 0, 1..., run as one batch"""
+    program = advent_tools.read_input_lines()
+    batch = advent_tools.AssembunnyBatch(program, len(seeds),
+                                         max_outputs=num_outputs,
+                                         max_steps=max_steps)
+    batch['a'] = seeds
+    batch.run()
+    expected = [i % 2 for i in range(num_outputs)]
+    return [outputs == expected for outputs in batch.outputs]
+
+
+def smallest_clock_signal_seed(batch_number, batch_size=256):
+    """Smallest seed in one batch which produces the clock signal, or None"""
+    seeds = range(batch_number * batch_size + 1,
+                  (batch_number + 1) * batch_size + 1)
+    # Screen the whole batch at once, and only check the ones that start
+    # off right all the way through
+    for seed, starts_right in zip(seeds,
+                                  starts_clock_signal(np.array(seeds))):
+        if starts_right and produces_clock_signal(seed):
+            return seed
+    return None
+
 
 def run_part_1():
-    count = 0
-    while True:
-        computer = MonorailComputer()
-        count = count + 1
-        print(count)
-        computer.registers['a'] = count
-        computer.run_input_file()
+    _, seed = advent_tools.smallest_passing_value(smallest_clock_signal_seed)
+    print(seed)
 
 
 def run_part_2():
@@ -4,12 +4,14 @@ import functools
 import advent_tools
 import hashlib
 
+
 def run_part_1():
     door_id = 'ffykfhsq'
     digits = ''
-    hash_series = advent_tools.md5_increment(door_id)
+    hash_series = advent_tools.parallel_md5_increment(
+        door_id, digest_predicate=advent_tools.LeadingZeroNibbles(5))
     while len(digits) < 8:
-        hash = next(hash_series)
+        _, hash = next(hash_series)
         if hash.startswith('0' * 5):
             digits = digits + hash[5]
             print(digits)
@@ -19,9 +21,10 @@ def run_part_1():
 def run_part_2():
     door_id = 'ffykfhsq'
     digits = ['_'] * 8
-    hash_series = advent_tools.md5_increment(door_id)
+    hash_series = advent_tools.parallel_md5_increment(
+        door_id, digest_predicate=advent_tools.LeadingZeroNibbles(5))
     while '_' in digits[:8]:
-        hash = next(hash_series)
+        _, hash = next(hash_series)
         if hash.startswith('0' * 5):
             position = hash[5]
             digit = hash[6]